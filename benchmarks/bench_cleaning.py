@@ -0,0 +1,79 @@
+"""
+
+Benchmark: clean_and_validate_data at several chunk sizes on a synthetic result
+file, checking that every chunked output is byte-identical to the unchunked one.
+
+    python -m benchmarks.bench_cleaning --rows 1000000 --chunksizes 10000 100000
+
+"""
+
+import argparse
+import filecmp
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.data_cleaning import TARGET_COLUMNS, clean_and_validate_data
+
+
+def synthetic_results(n, rng):
+    """
+    A result file whose columns change type part-way through, as real outputs do:
+    numeric ids that turn into text, whole seconds that turn fractional, a column
+    that is empty at first, scores that are sometimes floats or junk.
+    """
+    ids = np.arange(n).astype(object)
+    ids[n // 2:] = [f"Q{i:07d}" for i in range(n // 2, n)]
+    seconds = np.arange(n, dtype=float) % 60
+    seconds[-n // 10:] += 0.5
+    notes = np.full(n, "", dtype=object)
+    notes[-n // 10:] = "re-annotated"
+    frame = pd.DataFrame({
+        "argQ_id": ids,
+        "claim_text": [f"Claim {i}: margins improve" for i in range(n)],
+        "premise_texts": [f"{i % 97:03d}" for i in range(n)],
+        "seconds": [f"{value:g}" for value in seconds],
+        "notes": notes,
+    })
+    for col in TARGET_COLUMNS:
+        scores = rng.integers(0, 3, n).astype(object)
+        noisy = rng.random(n)
+        scores[noisy < 0.01] = "n/a"
+        scores[(noisy >= 0.01) & (noisy < 0.03)] = 1.4
+        scores[(noisy >= 0.03) & (noisy < 0.04)] = np.nan
+        frame[col] = scores
+    return frame
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunked cleaning benchmark")
+    parser.add_argument('--rows', type=int, default=200_000, help='Rows of the synthetic result file')
+    parser.add_argument('--chunksizes', type=int, nargs='+', default=[1_000, 10_000, 100_000],
+                        help='Chunk sizes compared with a single chunk')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "results.csv")
+        synthetic_results(args.rows, rng).to_csv(input_path, index=False)
+
+        print(f"{'chunksize':<12}{'seconds':>10}{'identical':>11}")
+        reference = None
+        for chunksize in [args.rows] + args.chunksizes:
+            output_path = os.path.join(tmp, f"clean_{chunksize}.csv")
+            start = time.perf_counter()
+            clean_and_validate_data(input_path, output_path, chunksize=chunksize)
+            elapsed = time.perf_counter() - start
+            if reference is None:
+                reference = output_path
+            identical = filecmp.cmp(reference, output_path, shallow=False)
+            print(f"{chunksize:<12}{elapsed:>10.3f}{'yes' if identical else 'NO':>11}")
+            if not identical:
+                raise SystemExit(f"chunksize {chunksize}: output differs from the unchunked output")
+
+
+if __name__ == "__main__":
+    main()
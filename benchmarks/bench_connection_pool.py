@@ -0,0 +1,58 @@
+"""
+
+Micro-benchmark: per-request overhead of get_annotation with a fresh session per
+call versus a pooled Annotator, against the local stub server.
+
+    python -m benchmarks.bench_connection_pool --requests 500 --concurrency 8
+
+"""
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.mock_server import MockLLMServer
+from src.annotation import Annotator, get_annotation
+
+PROMPT = "Claim: revenue grew.\nPremises: volume was up 12% year over year."
+
+
+def time_calls(call, n_requests, concurrency):
+    start = time.perf_counter()
+    if concurrency == 1:
+        for _ in range(n_requests):
+            call()
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda _: call(), range(n_requests)))
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Connection pooling micro-benchmark")
+    parser.add_argument('--requests', type=int, default=500, help='Requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='Threads for the concurrent scenario')
+    args = parser.parse_args()
+
+    with MockLLMServer() as server:
+        def fresh_session():
+            get_annotation(PROMPT, "stub", server.url, "key", 0.0)
+
+        with Annotator("stub", server.url, "key", 0.0, pool_size=args.concurrency) as annotator:
+            def pooled():
+                annotator.annotate(PROMPT)
+
+            # Warm up both paths once so imports and the first connect are not timed.
+            fresh_session()
+            pooled()
+
+            print(f"{'scenario':<28}{'total s':>10}{'ms/request':>14}")
+            for concurrency in (1, args.concurrency):
+                for name, call in (("fresh session", fresh_session), ("pooled Annotator", pooled)):
+                    elapsed = time_calls(call, args.requests, concurrency)
+                    label = f"{name} (x{concurrency})"
+                    print(f"{label:<28}{elapsed:>10.3f}{1000 * elapsed / args.requests:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+
+Benchmark: parse_annotation against the previous line-splitting parser over a
+corpus of answer variants seen from chat models.
+
+    python -m benchmarks.bench_parser --repeat 2000
+
+"""
+
+import argparse
+import time
+
+from src.annotation import parse_annotation
+
+# Answer variants, each expected to yield all four scores.
+RESPONSE_VARIANTS = [
+    "Strength: 2\nSpecificity: 1\nPersuasiveness: 2\nObjectivity: 1",
+    "Strength: 2 (strong)\nSpecificity: 1 (partial)\nPersuasiveness: 1\nObjectivity: 0 (subjective)",
+    "**Strength**: 1\n**Specificity**: 2\n**Persuasiveness**: 1\n**Objectivity**: 1",
+    "**Strength:** 1\n**Specificity:** 2\n**Persuasiveness:** 1\n**Objectivity:** 1",
+    "- Strength: [2]\n- Specificity: [1]\n- Persuasiveness: [2]\n- Objectivity: [1]",
+    "Here are the scores:\n\nStrength: 0\nSpecificity: 0\nPersuasiveness: 1\nObjectivity: 0\n\nNo justification provided.",
+    "Strength: 1, Specificity: 1, Persuasiveness: 1, Objectivity: 1",
+    "strength = 2\nspecificity = 2\npersuasiveness = 2\nobjectivity = 1",
+    "Strength (0-2): 1\nSpecificity (0-2): 2\nPersuasiveness (0-2): 1\nObjectivity (0-1): 1",
+    "Strength score: 2\nSpecificity score: 1\nPersuasiveness score: 1\nObjectivity score: 0",
+    '{"Strength": 2, "Specificity": 1, "Persuasiveness": 1, "Objectivity": 1}',
+    '```json\n{"Strength": 1, "Specificity": 1, "Persuasiveness": 0, "Objectivity": 1}\n```',
+    "| Dimension | Score |\n|---|---|\n| Strength | 1 |\n| Specificity | 2 |\n| Persuasiveness | 1 |\n| Objectivity | 0 |",
+    "    Strength: 2\n    Specificity: 2\n    Persuasiveness: 2\n    Objectivity: 1\n",
+]
+
+
+def legacy_parse_annotation(annotation):
+    """The line-splitting parser parse_annotation replaced."""
+    scores = {}
+    for line in annotation.split("\n"):
+        if "Strength:" in line:
+            scores["Strength"] = int(line.split(":")[1].strip())
+        elif "Specificity:" in line:
+            scores["Specificity"] = int(line.split(":")[1].strip())
+        elif "Persuasiveness:" in line:
+            scores["Persuasiveness"] = int(line.split(":")[1].strip())
+        elif "Objectivity:" in line:
+            scores["Objectivity"] = int(line.split(":")[1].strip())
+    return scores
+
+
+def run(parser, corpus, repeat):
+    complete = 0
+    for response in corpus:
+        try:
+            complete += len(parser(response)) == 4
+        except Exception:
+            pass
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for response in corpus:
+            try:
+                parser(response)
+            except Exception:
+                pass
+    elapsed = time.perf_counter() - start
+    return complete, 1e6 * elapsed / (repeat * len(corpus))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Response parser benchmark")
+    parser.add_argument('--repeat', type=int, default=2000, help='Passes over the corpus')
+    args = parser.parse_args()
+
+    print(f"{'parser':<16}{'complete':>12}{'us/response':>14}")
+    for name, fn in (("legacy", legacy_parse_annotation), ("regex", parse_annotation),
+                     ("regex+json", lambda text: parse_annotation(text, "json"))):
+        complete, per_response = run(fn, RESPONSE_VARIANTS, args.repeat)
+        print(f"{name:<16}{complete:>6}/{len(RESPONSE_VARIANTS):<5}{per_response:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+
+This module provides a local OpenAI-compatible chat-completions stub:
+ Answer every POST with a random but well-formed annotation (one indexed line
+ per argument for packed prompts) so the annotation client can be exercised
+ offline, optionally injecting 5xx errors, 429 throttling and malformed
+ answers at given rates. write_fake_batch_results does the same for the
+ batch mode, turning a batch-request JSONL into a batch-results JSONL.
+
+"""
+
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def random_annotation(rng):
+    return (
+        f"Strength: {rng.randint(0, 2)}\n"
+        f"Specificity: {rng.randint(0, 2)}\n"
+        f"Persuasiveness: {rng.randint(0, 2)}\n"
+        f"Objectivity: {rng.randint(0, 1)}"
+    )
+
+
+def random_json_annotation(rng):
+    return json.dumps({
+        "Strength": rng.randint(0, 2),
+        "Specificity": rng.randint(0, 2),
+        "Persuasiveness": rng.randint(0, 2),
+        "Objectivity": rng.randint(0, 1),
+    })
+
+
+def random_packed_annotation(rng, count):
+    return "\n".join(
+        f"[{i}] Strength: {rng.randint(0, 2)}, Specificity: {rng.randint(0, 2)}, "
+        f"Persuasiveness: {rng.randint(0, 2)}, Objectivity: {rng.randint(0, 1)}"
+        for i in range(1, count + 1)
+    )
+
+
+# Packed prompts (annotation.build_packed_prompt) say how many arguments they hold
+PACKED_COUNT_PATTERN = re.compile(r"annotate each of the (\d+) arguments")
+
+
+# Answers a model might give that carry no usable scores
+MALFORMED_ANSWERS = [
+    "I'm sorry, but I can't evaluate this argument.",
+    "Strength: high\nSpecificity: medium\nPersuasiveness: low\nObjectivity: yes",
+    "The argument is fairly strong and specific.",
+    "",
+]
+
+
+def write_fake_batch_results(requests_path, results_path, seed=42):
+    """Answer every line of a batch-request JSONL the way a batch endpoint would."""
+    rng = random.Random(seed)
+    with open(requests_path, encoding="utf-8") as src, open(results_path, "w", encoding="utf-8") as dst:
+        for index, line in enumerate(src):
+            request = json.loads(line)
+            result = {
+                "id": f"batch_req_{index}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {"choices": [{"message": {"role": "assistant", "content": random_annotation(rng)}}]},
+                },
+                "error": None,
+            }
+            dst.write(json.dumps(result) + "\n")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests, like a real provider.
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY a kept-alive
+    # connection stalls on Nagle + delayed ACK for ~40 ms per response.
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        if server.latency:
+            time.sleep(server.latency)
+        with server.lock:
+            server.request_count += 1
+            draw = server.rng.random()
+            if draw < server.throttle_rate:
+                server.throttled += 1
+                outcome = "throttle"
+            elif draw < server.throttle_rate + server.error_rate:
+                server.errors += 1
+                outcome = "error"
+            elif draw < server.throttle_rate + server.error_rate + server.malformed_rate:
+                server.malformed += 1
+                content = server.rng.choice(MALFORMED_ANSWERS)
+                outcome = "ok"
+            else:
+                json_mode = (payload.get("response_format") or {}).get("type") == "json_object"
+                packed = PACKED_COUNT_PATTERN.search(payload["messages"][-1]["content"]) if payload.get("messages") else None
+                if packed:
+                    content = random_packed_annotation(server.rng, int(packed.group(1)))
+                elif json_mode:
+                    content = random_json_annotation(server.rng)
+                else:
+                    content = random_annotation(server.rng)
+                outcome = "ok"
+        if outcome == "throttle":
+            self._send_json(429, {"error": {"message": "Rate limit reached"}},
+                            headers={"Retry-After": str(server.retry_after)})
+            return
+        if outcome == "error":
+            self._send_json(500, {"error": {"message": "Internal server error"}})
+            return
+        prompt_chars = sum(len(message.get("content", "")) for message in payload.get("messages", []))
+        self._send_json(200, {
+            "choices": [{"message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_chars // 4, "completion_tokens": len(content) // 4},
+        })
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+class MockLLMServer:
+    """
+    Background stub server; use as a context manager.
+
+    Parameters:
+        latency (float): Seconds to sleep before answering each request.
+        port (int): Port to bind on 127.0.0.1 (0 picks a free one).
+        seed (int): Seed for the random annotations and injected failures.
+        error_rate (float): Share of requests answered with HTTP 500.
+        throttle_rate (float): Share of requests answered with HTTP 429 and a Retry-After header.
+        malformed_rate (float): Share of requests answered with text that holds no valid scores.
+        retry_after (float): Seconds sent in the Retry-After header of a 429.
+    """
+
+    def __init__(self, latency=0.0, port=0, seed=42, error_rate=0.0, throttle_rate=0.0, malformed_rate=0.0,
+                 retry_after=0.05):
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.rng = random.Random(seed)
+        self.httpd.lock = threading.Lock()
+        self.httpd.request_count = 0
+        self.httpd.error_rate = error_rate
+        self.httpd.throttle_rate = throttle_rate
+        self.httpd.malformed_rate = malformed_rate
+        self.httpd.retry_after = retry_after
+        self.httpd.errors = 0
+        self.httpd.throttled = 0
+        self.httpd.malformed = 0
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/chat/completions"
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    def stats(self):
+        """Requests served and failures injected so far."""
+        return {
+            "requests": self.httpd.request_count,
+            "errors": self.httpd.errors,
+            "throttled": self.httpd.throttled,
+            "malformed": self.httpd.malformed,
+        }
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
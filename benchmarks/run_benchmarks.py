@@ -0,0 +1,206 @@
+"""
+
+Benchmark suite: the annotation client against the local stub server (with
+injected errors, 429s and malformed answers) and the metric modules on
+synthetic datasets, written to a JSON file so runs can be compared over time.
+
+    python -m benchmarks.run_benchmarks --sizes 1000 10000 100000 1000000 --output bench.json
+
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.mock_server import MockLLMServer
+from src.annotation import DIMENSION_COLUMNS, annotate_dataframe
+from src.annotation_delta_bias import merge_annotations
+from src.async_annotation import annotate_dataframe_concurrent
+from src.bias_metrics import bias_report, compute_mae_bias, compute_mape, compute_mbe
+from src.cohen_kappa_alldata import compute_cohen_kappa
+from src.fleiss_kappa import compute_fleiss_kappa
+from src.retry import RetryPolicy
+
+DIMENSIONS = list(DIMENSION_COLUMNS.values())
+
+
+def synthetic_arguments(n, rng):
+    """Input rows as run_annotation.py reads them."""
+    return pd.DataFrame({
+        "argQ_id": np.arange(n),
+        "claim_text": [f"Claim {i}: revenue will grow next quarter." for i in range(n)],
+        "premise_texts": [f"Premise {i}: order backlog is up {i % 40}% year over year." for i in range(n)],
+        "company_name": rng.choice([f"Company {c}" for c in range(50)], n),
+    })
+
+
+def synthetic_scores(n, rng):
+    """Aggregated scores in the ranges of each dimension (OBJECTIVE 0-1, the others 0-2)."""
+    return {dim: rng.integers(0, 2 if dim == "OBJECTIVE" else 3, n) for dim in DIMENSIONS}
+
+
+def synthetic_run_lists(n, rng, runs=3):
+    """Run-list columns as the results frame holds them (lists of ints)."""
+    columns = {}
+    for dim in DIMENSIONS:
+        scores = rng.integers(0, 2 if dim == "OBJECTIVE" else 3, (n, runs))
+        run_lists = np.empty(n, dtype=object)
+        run_lists[:] = scores.tolist()
+        columns[dim] = run_lists
+    return pd.DataFrame(columns)
+
+
+def timed(fn, repeat=1):
+    """Run `fn` `repeat` times; returns (best seconds, median seconds, last result)."""
+    durations = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        durations.append(time.perf_counter() - start)
+    return min(durations), float(np.median(durations)), result
+
+
+def record(results, benchmark, rows, best, median, **extra):
+    entry = {"benchmark": benchmark, "rows": rows, "seconds": round(best, 6), "median_seconds": round(median, 6)}
+    entry["rows_per_second"] = round(rows / best, 1) if best else None
+    entry.update(extra)
+    results.append(entry)
+    print(f"{benchmark:<36}{rows:>10}{best:>12.4f}s")
+
+
+def bench_annotation(results, args, rng):
+    df = synthetic_arguments(args.annotation_rows, rng)
+    policy = RetryPolicy(max_retries=5, base_delay=0.01, max_delay=0.1)
+    server_options = dict(
+        latency=args.latency, error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+        malformed_rate=args.malformed_rate,
+    )
+
+    with MockLLMServer(**server_options) as server:
+        with contextlib.redirect_stdout(io.StringIO()):
+            best, median, _ = timed(lambda: annotate_dataframe(
+                df, "stub", server.url, "key", 0.0, runs=args.runs, retry_policy=policy
+            ))
+        record(results, "annotate_dataframe", len(df), best, median, requests=server.stats())
+
+    with MockLLMServer(**server_options) as server:
+        with contextlib.redirect_stdout(io.StringIO()):
+            best, median, _ = timed(lambda: annotate_dataframe_concurrent(
+                df, "stub", server.url, "key", 0.0, runs=args.runs, concurrency=args.concurrency,
+                retry_policy=policy
+            ))
+        record(results, f"annotate_dataframe_concurrent x{args.concurrency}", len(df), best, median,
+               requests=server.stats())
+
+    with MockLLMServer(**server_options) as server, tempfile.TemporaryDirectory() as tmp:
+        data_path = os.path.join(tmp, "data.csv")
+        df.to_csv(data_path, index=False)
+        command = [
+            sys.executable, "-m", "scripts.run_annotation", "--data_path", data_path, "--model", "stub",
+            "--output", os.path.join(tmp, "out.csv"), "--api_endpoint", server.url, "--api_key", "key",
+            "--runs", str(args.runs), "--concurrency", str(args.concurrency),
+        ]
+        best, median, _ = timed(lambda: subprocess.run(command, check=True, capture_output=True))
+        record(results, f"run_annotation.py x{args.concurrency}", len(df), best, median, requests=server.stats())
+
+
+def bench_metrics(results, size, args, rng):
+    ground_truth = pd.DataFrame({"argQ_id": np.arange(size), **synthetic_scores(size, rng)})
+    unbiased = pd.DataFrame({"argQ_id": np.arange(size), **synthetic_scores(size, rng)})
+    biased = pd.DataFrame({"argQ_id": np.arange(size), **synthetic_scores(size, rng)}).sample(
+        frac=1, random_state=0
+    )
+    repeat = args.repeat
+
+    best, median, _ = timed(lambda: compute_cohen_kappa(ground_truth, unbiased, DIMENSIONS), repeat)
+    record(results, "compute_cohen_kappa", size, best, median)
+
+    run_lists = synthetic_run_lists(size, rng)
+    with contextlib.redirect_stdout(io.StringIO()):
+        best, median, _ = timed(lambda: compute_fleiss_kappa(run_lists.copy(), DIMENSIONS), repeat)
+    record(results, "compute_fleiss_kappa", size, best, median)
+
+    for name, fn in (("compute_mbe", compute_mbe), ("compute_mae_bias", compute_mae_bias), ("compute_mape", compute_mape)):
+        best, median, _ = timed(lambda: fn(unbiased, biased, DIMENSIONS), repeat)
+        record(results, name, size, best, median)
+    best, median, _ = timed(lambda: bias_report(unbiased, biased, DIMENSIONS, n_boot=args.n_boot), repeat)
+    record(results, f"bias_report n_boot={args.n_boot}", size, best, median)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        arguments = synthetic_arguments(size, rng)
+        paths = []
+        for name in ("original", "llm", "female", "male"):
+            path = os.path.join(tmp, f"{name}.csv")
+            arguments[["argQ_id", "claim_text", "premise_texts"]].assign(**synthetic_scores(size, rng)).to_csv(
+                path, index=False
+            )
+            paths.append(path)
+        best, median, _ = timed(lambda: merge_annotations(*paths, dimensions=DIMENSIONS), repeat)
+        record(results, "merge_annotations", size, best, median)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000, 1_000_000],
+                        help='Synthetic dataset sizes for the metric benchmarks')
+    parser.add_argument('--annotation_rows', type=int, default=100, help='Rows annotated against the stub server')
+    parser.add_argument('--runs', type=int, default=3, help='Runs per argument')
+    parser.add_argument('--concurrency', type=int, default=16, help='Requests in flight for the concurrent client')
+    parser.add_argument('--latency', type=float, default=0.01, help='Stub server latency per request in seconds')
+    parser.add_argument('--error_rate', type=float, default=0.02, help='Share of requests answered with HTTP 500')
+    parser.add_argument('--throttle_rate', type=float, default=0.05, help='Share of requests answered with HTTP 429')
+    parser.add_argument('--malformed_rate', type=float, default=0.02, help='Share of answers without valid scores')
+    parser.add_argument('--n_boot', type=int, default=1000, help='Bootstrap resamples for bias_report')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed repetitions of each metric benchmark')
+    parser.add_argument('--skip_annotation', action='store_true', help='Only run the metric benchmarks')
+    parser.add_argument('--output', type=str, default=None,
+                        help='JSON results file (default: benchmarks/results/<timestamp>.json)')
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    results = []
+    print(f"{'benchmark':<36}{'rows':>10}{'best':>13}")
+    if not args.skip_annotation:
+        bench_annotation(results, args, rng)
+    for size in args.sizes:
+        bench_metrics(results, size, args, rng)
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", time.strftime("%Y%m%d-%H%M%S") + ".json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "config": vars(args),
+        "results": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Benchmark results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
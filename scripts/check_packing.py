@@ -0,0 +1,45 @@
+import argparse
+import pandas as pd
+from src.cache import ResponseCache
+from src.checkpoint import REQUIRED_COLUMNS
+from src.packing import compare_pack_sizes
+from src.retry import RetryPolicy
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare packed prompting (K arguments per request) with single requests")
+    parser.add_argument('--data_path', type=str, required=True, help='CSV file with the arguments')
+    parser.add_argument('--model', type=str, required=True, help='Model name, e.g., llama3.1')
+    parser.add_argument('--api_endpoint', type=str, required=True, help='API endpoint')
+    parser.add_argument('--api_key', type=str, required=True, help='API key')
+    parser.add_argument('--temperature', type=float, default=0.0, help='Temperature (0 isolates the effect of packing)')
+    parser.add_argument('--pack_sizes', type=int, nargs='+', default=[2, 4, 8], help='Arguments per request to compare')
+    parser.add_argument('--sample', type=int, default=100, help='Rows sampled from the data')
+    parser.add_argument('--runs', type=int, default=1, help='Runs per argument')
+    parser.add_argument('--prompt_type', type=str, default="unbiased", choices=["unbiased", "bias"])
+    parser.add_argument('--bias_type', type=str, default="female", choices=["female", "male"])
+    parser.add_argument('--concurrency', type=int, default=8, help='Maximum number of requests in flight')
+    parser.add_argument('--max_retries', type=int, default=5, help='Retries per call for 429/5xx/timeouts')
+    parser.add_argument('--cache', type=str, default=None, help='SQLite response cache file')
+    parser.add_argument('--output', type=str, default=None, help='CSV file for the comparison table')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data_path).dropna(subset=REQUIRED_COLUMNS)
+    if len(df) > args.sample:
+        df = df.sample(n=args.sample, random_state=42)
+    cache = ResponseCache(args.cache) if args.cache else None
+
+    table = compare_pack_sizes(
+        df, args.model, args.api_endpoint, args.api_key, args.temperature, pack_sizes=args.pack_sizes,
+        runs=args.runs, prompt_type=args.prompt_type, bias_type=args.bias_type, concurrency=args.concurrency,
+        cache=cache, retry_policy=RetryPolicy(max_retries=args.max_retries)
+    )
+    print(table.round(3).to_string(index=False))
+    if args.output:
+        table.to_csv(args.output, index=False)
+        print(f"Packing comparison saved to {args.output}")
+    if cache is not None:
+        cache.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import argparse
+from src.data_cleaning import clean_directory
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean and validate annotation CSVs in parallel")
+    parser.add_argument('--pattern', type=str, required=True,
+                        help='Glob of the CSV files to clean, e.g. "results/**/*.csv"')
+    parser.add_argument('--output_dir', type=str, required=True, help='Directory for the cleaned files')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: one per core)')
+    parser.add_argument('--chunksize', type=int, default=100_000, help='Rows cleaned per chunk')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='Content-hash manifest (default: <output_dir>/manifest.json)')
+    parser.add_argument('--summary', type=str, default=None,
+                        help='Summary CSV (default: <output_dir>/cleaning_summary.csv)')
+    parser.add_argument('--force', action='store_true', help='Clean every file, even if unchanged')
+    args = parser.parse_args()
+
+    summary = clean_directory(
+        args.pattern, args.output_dir, workers=args.workers, chunksize=args.chunksize,
+        manifest_path=args.manifest, summary_path=args.summary, force=args.force
+    )
+    if len(summary):
+        print(f"{int(summary['valid'].sum())}/{len(summary)} files passed validation")
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,258 @@
 import argparse
-import os
+import contextlib
+
 import pandas as pd
-from src.annotation import annotate_dataframe
+
+from src.annotation import SETTINGS, AdaptiveRuns, estimate_dataset_tokens, setting_name
+from src.async_annotation import annotate_batches_concurrent, annotate_models_concurrent
+from src.cache import ResponseCache
+from src.checkpoint import ResultWriter, completed_ids, iter_pending_batches
+from src.endpoints import EndpointPool, load_endpoint_config, model_output_path
+from src.prompts import BudgetExceededError, TokenBudget
+from src.retry import FailureLedger, RetryPolicy
+from src.telemetry import Telemetry
 
 
 def main():
     parser = argparse.ArgumentParser(description="LLM Annotation Experiment Runner")
     parser.add_argument('--data_path', type=str, required=True, help='CSV file to annotate')
-    parser.add_argument('--model', type=str, required=True, help='Model name, e.g., llama3.1')
+    parser.add_argument('--model', type=str, default=None, help='Model name, e.g., llama3.1')
     parser.add_argument('--temperature', type=float, default=0.7, help='Temperature setting')
-    parser.add_argument('--output', type=str, required=True, help='Output CSV path')
-    parser.add_argument('--api_endpoint', type=str, required=True, help='API endpoint')
-    parser.add_argument('--api_key', type=str, required=True, help='API key')
+    parser.add_argument('--output', type=str, required=True,
+                        help='Output path (.csv, .jsonl or .parquet); with --config, {model} is replaced by each model name')
+    parser.add_argument('--api_endpoint', type=str, default=None, help='API endpoint (not needed with --replay)')
+    parser.add_argument('--api_key', type=str, default=None, help='API key (not needed with --replay)')
+    parser.add_argument('--config', type=str, default=None,
+                        help='YAML file of models and their endpoints (weights, concurrency); replaces '
+                             '--model/--api_endpoint and annotates every model in one pass')
     parser.add_argument('--runs', type=int, default=3, help='How many times to annotate each argument')
+    parser.add_argument('--max_runs', type=int, default=None,
+                        help='Adaptive runs: make --min_runs runs per argument and more, up to this many, '
+                             'only while they disagree (overrides --runs)')
+    parser.add_argument('--min_runs', type=int, default=2, help='Runs always made in adaptive mode')
+    parser.add_argument('--agreement', type=float, default=1.0,
+                        help='Adaptive mode stops once the most common score of every dimension has this '
+                             'share of the runs (1.0: all runs agree)')
+    parser.add_argument('--pack_size', type=int, default=1,
+                        help='Arguments scored per request under one shared rubric (text answers); arguments '
+                             'the packed answer misses are re-requested one by one')
     parser.add_argument('--prompt_type', type=str, default="unbiased", choices=["unbiased", "bias"],
                         help='Type of prompt to use: unbiased or bias-injected')
     parser.add_argument('--bias_type', type=str, default="female", choices=["female", "male"],
                         help='If using bias-injected prompt, which bias: female or male')
+    parser.add_argument('--settings', type=str, nargs='+', default=None, choices=list(SETTINGS),
+                        help='Annotate several settings in one pass (e.g. unbiased female male) and write '
+                             'one long-format row per argQ_id, setting and run; overrides --prompt_type')
+    parser.add_argument('--response_format', type=str, default="text", choices=["text", "json"],
+                        help='Ask for plain-text scores or a JSON object (provider JSON mode)')
+    parser.add_argument('--concurrency', type=int, default=1, help='Maximum number of requests in flight')
+    parser.add_argument('--rpm', type=float, default=None, help='Requests-per-minute limit (default: unlimited)')
+    parser.add_argument('--tpm', type=float, default=None, help='Estimated tokens-per-minute limit (default: unlimited)')
+    parser.add_argument('--cache', type=str, default=None, help='SQLite response cache file')
+    parser.add_argument('--cache_max_mb', type=float, default=None,
+                        help='Evict least recently used cache entries above this size')
+    parser.add_argument('--replay', action='store_true',
+                        help='Read-only replay from --cache; never call the API')
+    parser.add_argument('--batch_size', type=int, default=100,
+                        help='Rows read, annotated and appended to the output per batch')
+    parser.add_argument('--resume', action='store_true',
+                        help='Keep the existing output and skip argQ_ids it already contains')
+    parser.add_argument('--max_retries', type=int, default=5,
+                        help='Retries per call for 429/5xx/timeouts, with jittered exponential backoff')
+    parser.add_argument('--failures', type=str, default=None,
+                        help='CSV ledger of runs that still failed after retries')
+    parser.add_argument('--max_tokens', type=int, default=None,
+                        help='Completion token limit (default: sized from the expected four-score answer)')
+    parser.add_argument('--token_budget', type=int, default=None,
+                        help='Stop once the estimated prompt + completion tokens of the run would exceed this')
+    parser.add_argument('--cost_budget', type=float, default=None,
+                        help='Stop once the estimated cost of the run would exceed this')
+    parser.add_argument('--prompt_price', type=float, default=0.0, help='Price per 1,000 prompt tokens')
+    parser.add_argument('--completion_price', type=float, default=0.0, help='Price per 1,000 completion tokens')
+    parser.add_argument('--trace', type=str, default=None,
+                        help='JSONL file receiving one record per API call (latency, TTFB, tokens, outcome)')
+    parser.add_argument('--progress', action='store_true',
+                        help='Show a live progress line (req/s, ETA, p50/p95 latency) instead of per-row prints')
+    parser.add_argument('--estimate_only', action='store_true',
+                        help='Print the offline token/cost estimate for the pending rows and exit')
     args = parser.parse_args()
+    if args.replay and not args.cache:
+        parser.error("--replay requires --cache")
+    if args.config is None and args.model is None:
+        parser.error("--model is required unless --config is set")
+    if args.config is None and not (args.replay or args.estimate_only) and (
+            args.api_endpoint is None or args.api_key is None):
+        parser.error("--api_endpoint and --api_key are required unless --replay or --config is set")
+
+    if args.pack_size < 1:
+        parser.error("--pack_size must be at least 1")
+    if args.pack_size > 1 and (args.max_runs is not None or args.response_format == "json"):
+        parser.error("--pack_size needs fixed --runs and --response_format text")
+
+    adaptive = None
+    if args.max_runs is not None:
+        try:
+            adaptive = AdaptiveRuns(args.min_runs, args.max_runs, args.agreement)
+        except ValueError as e:
+            parser.error(str(e))
+    runs = args.max_runs if adaptive is not None else args.runs
+
+    cache = None
+    if args.cache:
+        max_bytes = int(args.cache_max_mb * 1024 * 1024) if args.cache_max_mb else None
+        cache = ResponseCache(args.cache, max_bytes=max_bytes, read_only=args.replay)
+
+    if args.config:
+        models = load_endpoint_config(args.config, api_key=args.api_key)
+        outputs = {
+            model["name"]: model["output"] or model_output_path(args.output, model["name"], len(models))
+            for model in models
+        }
+    else:
+        models = None
+        outputs = {args.model: args.output}
+
+    # Skip arguments already present in the output when resuming
+    done_ids = {model: completed_ids(output) if args.resume else set() for model, output in outputs.items()}
+    for model, ids in done_ids.items():
+        if ids:
+            print(f"Resuming: {len(ids)} arguments already annotated in {outputs[model]}")
+    # Rows every model has already annotated are not read again
+    done_by_all = set.intersection(*done_ids.values())
+
+    settings = args.settings or [setting_name(args.prompt_type, args.bias_type)]
+    if args.estimate_only:
+        budget = TokenBudget(prompt_price=args.prompt_price, completion_price=args.completion_price)
+        totals = {}
+        for batch in iter_pending_batches(args.data_path, args.batch_size, done_by_all):
+            for ids in done_ids.values():
+                pending = batch[~batch['argQ_id'].astype(str).isin(ids)]
+                estimate = estimate_dataset_tokens(
+                    pending, settings, runs, args.response_format, args.max_tokens, args.pack_size
+                )
+                for name, value in estimate.items():
+                    totals[name] = totals.get(name, 0) + value
+        for name, value in totals.items():
+            print(f"{name}: {value}")
+        print(f"estimated cost: {budget.cost(totals.get('prompt_tokens', 0), totals.get('completion_tokens', 0)):.4f}")
+        return
+
+    ledgers = {model: FailureLedger() for model in outputs}
+    budget = None
+    if args.token_budget is not None or args.cost_budget is not None:
+        budget = TokenBudget(args.token_budget, args.cost_budget, args.prompt_price, args.completion_price)
+
+    # Rows left to annotate per model, for progress messages
+    pending = {model: 0 for model in done_ids}
+    for batch in iter_pending_batches(args.data_path, args.batch_size, done_by_all):
+        for model, ids in done_ids.items():
+            pending[model] += int((~batch['argQ_id'].astype(str).isin(ids)).sum())
+
+    telemetry = None
+    if args.trace or args.progress:
+        telemetry = Telemetry(args.trace, total=sum(pending.values()), progress=args.progress)
+
+    # Read data in batches and append each annotated batch to the output(s)
+    batches = iter_pending_batches(args.data_path, args.batch_size, done_by_all)
+    with contextlib.ExitStack() as stack:
+        writers = {
+            model: stack.enter_context(ResultWriter(output, append=args.resume)) for model, output in outputs.items()
+        }
+        try:
+            if models is None:
+                annotate_batches_concurrent(
+                    batches,
+                    writers[args.model].write,
+                    args.model,
+                    args.api_endpoint,
+                    args.api_key,
+                    args.temperature,
+                    runs=args.runs,
+                    prompt_type=args.prompt_type,
+                    bias_type=args.bias_type,
+                    concurrency=args.concurrency,
+                    rpm=args.rpm,
+                    tpm=args.tpm,
+                    cache=cache,
+                    total=pending[args.model],
+                    settings=args.settings,
+                    retry_policy=RetryPolicy(max_retries=args.max_retries),
+                    ledger=ledgers[args.model],
+                    response_format=args.response_format,
+                    max_tokens=args.max_tokens,
+                    budget=budget,
+                    telemetry=telemetry,
+                    adaptive=adaptive,
+                    pack_size=args.pack_size
+                )
+            else:
+                pools = {
+                    model["name"]: stack.enter_context(EndpointPool(
+                        model["name"], model["endpoints"], args.temperature, cache=cache,
+                        response_format=args.response_format, max_tokens=args.max_tokens
+                    ))
+                    for model in models
+                }
+                if not args.replay:
+                    for name, pool in pools.items():
+                        print(f"{name}: {pool.check_health()}/{len(pool.endpoints)} endpoints healthy, "
+                              f"concurrency {pool.concurrency}")
+                annotate_models_concurrent(
+                    batches,
+                    lambda model, frame: writers[model].write(frame),
+                    pools,
+                    runs=args.runs,
+                    prompt_type=args.prompt_type,
+                    bias_type=args.bias_type,
+                    settings=args.settings,
+                    concurrency={name: pool.concurrency for name, pool in pools.items()},
+                    rate_limits={
+                        model["name"]: (model["rpm"] or args.rpm, model["tpm"] or args.tpm) for model in models
+                    },
+                    done_ids=done_ids,
+                    retry_policy=RetryPolicy(max_retries=args.max_retries),
+                    ledgers=ledgers,
+                    budget=budget,
+                    telemetry=telemetry,
+                    adaptive=adaptive,
+                    pack_size=args.pack_size
+                )
+                print(pd.concat([pool.stats() for pool in pools.values()], ignore_index=True).to_string(index=False))
+        except BudgetExceededError as e:
+            print(f"{e}; stopping. Completed batches are kept, continue later with --resume.")
 
-    # Read data
-    df = pd.read_csv(args.data_path)
-    # Drop NaN if needed
-    df = df.dropna(subset=['argQ_id', 'claim_text', 'premise_texts', 'company_name'])
-
-    # Annotate
-    results_df = annotate_dataframe(
-        df,
-        args.model,
-        args.api_endpoint,
-        args.api_key,
-        args.temperature,
-        runs=args.runs,
-        prompt_type=args.prompt_type,
-        bias_type=args.bias_type
-    )
-
-    # Save
-    os.makedirs(os.path.dirname(args.output), exist_ok=True)
-    results_df.to_csv(args.output, index=False)
-    print(f"Annotation process completed and results saved to {args.output}")
+    if telemetry is not None:
+        telemetry.report()
+        telemetry.close()
+    for model, writer in writers.items():
+        print(f"Annotation process completed and {writer.rows_written} results saved to {outputs[model]}")
+    if budget is not None:
+        spent = budget.summary()
+        print(f"Budget: {spent['requests']} requests, ~{spent['prompt_tokens']} prompt + "
+              f"~{spent['completion_tokens']} completion tokens, ~{spent['cost']:.4f} cost")
+    if models is None:
+        ledger = ledgers[args.model]
+        failures = ledger.to_frame()
+    else:
+        # One ledger for every model, with the model as first column
+        failures = pd.concat(
+            [ledger.to_frame().assign(model=model) for model, ledger in ledgers.items()], ignore_index=True
+        )
+        failures = failures[["model"] + FailureLedger.COLUMNS]
+    if len(failures):
+        print(f"{len(failures)} runs failed on {failures['argQ_id'].nunique()} arguments")
+    if args.failures:
+        if models is None:
+            ledger.save(args.failures)
+        else:
+            failures.to_csv(args.failures, index=False)
+            print(f"Failure ledger saved to {args.failures}")
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.1%} hit rate), {stats['evictions']} evictions, "
+              f"{stats['size_bytes'] / 1024 / 1024:.1f} MB stored")
+        cache.close()
 
 if __name__ == "__main__":
     main()
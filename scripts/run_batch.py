@@ -0,0 +1,49 @@
+import argparse
+import pandas as pd
+from src.batch import assemble_batch_results, build_batch_requests
+from src.result_io import save_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline batch annotation: build requests / ingest results")
+    parser.add_argument('phase', choices=["build", "ingest"],
+                        help='build: write the batch-request JSONL; ingest: turn batch results into a results file')
+    parser.add_argument('--data_path', type=str, required=True, help='CSV file to annotate')
+    parser.add_argument('--requests', type=str, required=True, help='Batch-request JSONL (written by build)')
+    parser.add_argument('--results', type=str, default=None, help='Batch-results JSONL (read by ingest)')
+    parser.add_argument('--output', type=str, default=None, help='Output path, .csv, .jsonl or .parquet (ingest)')
+    parser.add_argument('--model', type=str, default=None, help='Model name, e.g., llama3.1 (build)')
+    parser.add_argument('--temperature', type=float, default=0.7, help='Temperature setting')
+    parser.add_argument('--runs', type=int, default=3, help='How many times to annotate each argument')
+    parser.add_argument('--prompt_type', type=str, default="unbiased", choices=["unbiased", "bias"],
+                        help='Type of prompt to use: unbiased or bias-injected')
+    parser.add_argument('--bias_type', type=str, default="female", choices=["female", "male"],
+                        help='If using bias-injected prompt, which bias: female or male')
+    parser.add_argument('--response_format', type=str, default="text", choices=["text", "json"],
+                        help='Ask for plain-text scores or a JSON object')
+    args = parser.parse_args()
+
+    df = pd.read_csv(args.data_path)
+    df = df.dropna(subset=['argQ_id', 'claim_text', 'premise_texts', 'company_name'])
+
+    if args.phase == "build":
+        if args.model is None:
+            parser.error("build requires --model")
+        count = build_batch_requests(
+            df, args.requests, args.model, args.temperature,
+            runs=args.runs, prompt_type=args.prompt_type, bias_type=args.bias_type,
+            response_format=args.response_format
+        )
+        print(f"Wrote {count} batch requests to {args.requests}")
+    else:
+        if args.results is None or args.output is None:
+            parser.error("ingest requires --results and --output")
+        results_df = assemble_batch_results(
+            df, args.results, runs=args.runs, prompt_type=args.prompt_type, bias_type=args.bias_type,
+            response_format=args.response_format
+        )
+        save_results(results_df, args.output)
+        print(f"Batch results assembled and saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import argparse
+from src.evaluation import LABEL_PATTERN, evaluate_results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate every annotation result file against the ground truth")
+    parser.add_argument('--ground_truth', type=str, required=True, help='Human annotations (argQ_id + dimensions)')
+    parser.add_argument('--results', type=str, required=True,
+                        help='Glob of result files named <model>_<setting>, e.g. "results/**/*.parquet"')
+    parser.add_argument('--output', type=str, required=True, help='Consolidated table (.csv, .jsonl or .parquet)')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='Content-hash manifest (default: <output>.manifest.json)')
+    parser.add_argument('--n_boot', type=int, default=0, help='Bootstrap resamples for bias-metric intervals')
+    parser.add_argument('--workers', type=int, default=None, help='Threads for loading and per-file metrics')
+    parser.add_argument('--label_pattern', type=str, default=LABEL_PATTERN,
+                        help='Regex with model and setting groups, matched against the file name')
+    parser.add_argument('--force', action='store_true', help='Recompute every file, even if unchanged')
+    args = parser.parse_args()
+
+    table = evaluate_results(
+        args.ground_truth, args.results, args.output, manifest_path=args.manifest, workers=args.workers,
+        n_boot=args.n_boot, label_pattern=args.label_pattern, force=args.force
+    )
+    print(f"{len(table)} metric values for {table[['model', 'setting']].drop_duplicates().shape[0]} model/settings")
+
+if __name__ == "__main__":
+    main()
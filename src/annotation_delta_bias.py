@@ -1,7 +1,14 @@
 
 
+import numpy as np
 import pandas as pd
 
+from src.annotation import SCORE_DTYPE
+from src.result_io import load_results
+
+# Column suffix given to each prompt setting's annotations in the merged frame
+SETTING_SUFFIXES = {"unbiased": "_llm", "female": "_llm_female", "male": "_llm_male"}
+
 def create_composite_key(df, key_cols=None):
     """
     Create a composite key for each row by concatenating specified columns.
@@ -15,29 +22,85 @@ def rename_annotation_columns(df, dimensions, suffix):
     rename_dict = {dim: f"{dim}{suffix}" for dim in dimensions}
     return df.rename(columns=rename_dict)
 
-def compute_bias(merged_df, dimensions):
-    
-    def bias_commentary(delta):
-        if delta > 0:
-            return " (positively biased)"
-        elif delta < 0:
-            return " (negatively biased)"
-        else:
-            return " (neutral)"
-    
-    for dim in dimensions:
-        merged_df[f'{dim}_female_llm_delta'] = merged_df[f'{dim}_llm_female'] - merged_df[f'{dim}_llm']
-        merged_df[f'{dim}_male_llm_delta'] = merged_df[f'{dim}_llm_male'] - merged_df[f'{dim}_llm']
-        
-        merged_df[f'{dim}_llm_female_evals'] = merged_df[f'{dim}_llm_female'].astype(str) + \
-            merged_df[f'{dim}_female_llm_delta'].apply(bias_commentary)
-        merged_df[f'{dim}_llm_male_evals'] = merged_df[f'{dim}_llm_male'].astype(str) + \
-            merged_df[f'{dim}_male_llm_delta'].apply(bias_commentary)
+# Commentary appended to a biased score, indexed by sign(delta) + 1
+BIAS_COMMENTS = np.array([" (negatively biased)", " (neutral)", " (positively biased)"], dtype=object)
+
+def _score_block(merged_df, columns):
+    """(n, len(columns)) array of the score columns; float with NaN if any are nullable or missing."""
+    block = merged_df[columns]
+    if all(isinstance(dtype, np.dtype) for dtype in block.dtypes):
+        return block.to_numpy()
+    return block.to_numpy(dtype="float64", na_value=np.nan)
+
+def bias_deltas(merged_df, dimensions, settings=("female", "male")):
+    """
+    Signed deltas (biased minus unbiased LLM score) for every setting and
+    dimension, as one (n_rows, n_settings, n_dimensions) array.
+    """
+    unbiased = _score_block(merged_df, [f"{dim}_llm" for dim in dimensions])
+    biased = np.stack(
+        [_score_block(merged_df, [f"{dim}_llm_{setting}" for dim in dimensions]) for setting in settings], axis=1
+    )
+    return biased - unbiased[:, None, :]
+
+def bias_commentary_codes(scores, deltas):
+    """
+    Categorical "<score> (positively biased|negatively biased|neutral)" labels
+    for a score column, built from its few distinct values instead of one
+    Python string per cell. NaN deltas count as neutral, as before.
+    """
+    sign = np.select([deltas > 0, deltas < 0], [2, 0], default=1)
+    codes, uniques = pd.factorize(scores, use_na_sentinel=False)
+    labels = pd.Series(uniques).astype(str)
+    categories = [f"{label}{comment}" for label in labels for comment in BIAS_COMMENTS]
+    return pd.Categorical.from_codes(codes * len(BIAS_COMMENTS) + sign, categories)
+
+def compute_bias(merged_df, dimensions, commentary=True, return_deltas=False):
+    """
+    Add {dim}_female_llm_delta / {dim}_male_llm_delta columns and, unless
+    commentary=False, the categorical {dim}_llm_female_evals / {dim}_llm_male_evals
+    labels to `merged_df`.
+
+    With return_deltas=True, also return the deltas as a compact float32 block
+    with (setting, dimension) columns, ready for bias_metrics.summarize_deltas.
+    """
+    settings = ["female", "male"]
+    deltas = bias_deltas(merged_df, dimensions, settings)
+    for d, dim in enumerate(dimensions):
+        for s, setting in enumerate(settings):
+            # Keep the dtype plain column subtraction gives (int64 for int scores, nullable ints for SCORE_DTYPE ones)
+            dtype = (merged_df[f'{dim}_llm_{setting}'].iloc[:0] - merged_df[f'{dim}_llm'].iloc[:0]).dtype
+            merged_df[f'{dim}_{setting}_llm_delta'] = pd.array(deltas[:, s, d]).astype(dtype)
+        if commentary:
+            for s, setting in enumerate(settings):
+                merged_df[f'{dim}_llm_{setting}_evals'] = bias_commentary_codes(
+                    merged_df[f'{dim}_llm_{setting}'], deltas[:, s, d]
+                )
+    if return_deltas:
+        columns = pd.MultiIndex.from_product([settings, dimensions], names=["setting", "dimension"])
+        delta_block = pd.DataFrame(
+            deltas.reshape(len(merged_df), -1).astype(np.float32), index=merged_df.index, columns=columns
+        )
+        return merged_df, delta_block
     return merged_df
 
-def merge_annotations(original_path, llm_path, female_path, male_path, dimensions=None, usecols=None):
+def hash_key_columns(df, key_cols=None):
+    """
+    Vectorized 64-bit hash of the key columns of every row; the compact
+    equivalent of create_composite_key. Non-string columns are hashed by their
+    string form, so keys match exactly when their composite keys would.
+    """
+    if key_cols is None:
+        key_cols = ['premise_texts', 'argQ_id', 'claim_text']
+    keys = pd.DataFrame({
+        col: df[col] if df[col].dtype == object else df[col].astype(str) for col in key_cols
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+def merge_annotations(original_path, llm_path, female_path, male_path, dimensions=None, usecols=None,
+                      verify_keys=False):
     """
-    Merge annotation CSV files and compute bias commentary.
+    Merge annotation files (CSV, JSONL or Parquet) and compute bias commentary.
     
     Parameters:
         original_path (str): Path to the original annotations CSV.
@@ -48,6 +111,8 @@ def merge_annotations(original_path, llm_path, female_path, male_path, dimension
                            ["SPECIFIC", "PERSUASIVE", "STRONG", "OBJECTIVE"].
         usecols (list): List of columns to load. Defaults to
                         ['argQ_id', 'claim_text', 'premise_texts'] + dimensions.
+        verify_keys (bool): Compare the key columns of every joined row to rule
+                            out 64-bit hash collisions (raises ValueError).
                         
     Returns:
         pd.DataFrame: The final merged DataFrame with bias commentary columns.
@@ -56,47 +121,80 @@ def merge_annotations(original_path, llm_path, female_path, male_path, dimension
         dimensions = ["SPECIFIC", "PERSUASIVE", "STRONG", "OBJECTIVE"]
     if usecols is None:
         usecols = ['argQ_id', 'claim_text', 'premise_texts'] + dimensions
+    key_cols = ['premise_texts', 'argQ_id', 'claim_text']
 
-    # Load CSV files
-    df_orig = pd.read_csv(original_path, usecols=usecols)
-    df_llm = pd.read_csv(llm_path, usecols=usecols)
-    df_female = pd.read_csv(female_path, usecols=usecols)
-    df_male = pd.read_csv(male_path, usecols=usecols)
-    
-    # Create composite keys and drop duplicates
-    for df in [df_orig, df_llm, df_female, df_male]:
-        df['join_key'] = create_composite_key(df)
-        df.drop_duplicates(subset='join_key', inplace=True)
-    
-    # Rename annotation columns for clarity
-    df_orig = rename_annotation_columns(df_orig, dimensions, '_orig')
-    df_llm = rename_annotation_columns(df_llm, dimensions, '_llm')
-    df_female = rename_annotation_columns(df_female, dimensions, '_llm_female')
-    df_male = rename_annotation_columns(df_male, dimensions, '_llm_male')
-    
-    # Merge DataFrames on join_key
-    merged = df_orig.merge(df_llm, on='join_key', how='inner', suffixes=('', '_llm'))
-    for col in ['argQ_id', 'premise_texts', 'claim_text']:
-        dup = col + '_llm'
-        if dup in merged.columns:
-            merged.drop(columns=dup, inplace=True)
-    
-    merged = merged.merge(df_female, on='join_key', how='inner', suffixes=('', '_llm_female'))
-    for col in ['argQ_id', 'premise_texts', 'claim_text']:
-        dup = col + '_llm_female'
-        if dup in merged.columns:
-            merged.drop(columns=dup, inplace=True)
-    
-    merged = merged.merge(df_male, on='join_key', how='inner', suffixes=('', '_llm_male'))
-    for col in ['argQ_id', 'premise_texts', 'claim_text']:
-        dup = col + '_llm_male'
-        if dup in merged.columns:
-            merged.drop(columns=dup, inplace=True)
-            
- 
-    merged.drop(columns='join_key', inplace=True)
-    
+    # Load each file once, hash its key columns and drop duplicate keys
+    frames = []
+    for path in [original_path, llm_path, female_path, male_path]:
+        df = load_results(path, columns=usecols)
+        hashes = hash_key_columns(df, key_cols)
+        first = ~pd.Index(hashes).duplicated()
+        frames.append((df[first].reset_index(drop=True), hashes[first]))
+
+    # Keep the original rows (in their order) whose key is present in every file
+    (df_orig, orig_hashes), others = frames[0], frames[1:]
+    positions = [pd.Index(hashes).get_indexer(orig_hashes) for _, hashes in others]
+    present = np.logical_and.reduce([pos >= 0 for pos in positions])
+    merged = rename_annotation_columns(df_orig[present].reset_index(drop=True), dimensions, '_orig')
+
+    # One aligned column block per annotation file, named as the successive merges named them
+    for (df, _), pos, suffix in zip(others, positions, ['_llm', '_llm_female', '_llm_male']):
+        aligned = df.iloc[pos[present]].reset_index(drop=True)
+        if verify_keys:
+            for col in key_cols:
+                if not (aligned[col].astype(str) == merged[col].astype(str)).all():
+                    raise ValueError(f"Hash collision on {col} while joining {suffix} annotations")
+        aligned = rename_annotation_columns(aligned.drop(columns=key_cols), dimensions, suffix)
+        aligned.columns = [col + suffix if col in merged.columns else col for col in aligned.columns]
+        merged = pd.concat([merged, aligned], axis=1)
 
     merged = compute_bias(merged, dimensions)
     
     return merged
+
+def pivot_settings(long_df, dimensions=None):
+    """
+    Pivot a long-format result table (one row per argQ_id, setting and run, as
+    written by run_annotation.py --settings) into one row per argQ_id.
+
+    Each setting's runs are averaged and rounded, like annotate_dataframe does,
+    into columns named {dim}_llm, {dim}_llm_female and {dim}_llm_male.
+    Arguments whose runs all failed get <NA> instead of breaking the pivot.
+    """
+    if dimensions is None:
+        dimensions = ["SPECIFIC", "PERSUASIVE", "STRONG", "OBJECTIVE"]
+    scores = long_df.groupby(['argQ_id', 'setting'], sort=False)[dimensions].mean().round()
+    wide = scores.unstack('setting')
+    settings = [setting for setting in SETTING_SUFFIXES if setting in wide.columns.get_level_values('setting')]
+    columns = [(dim, setting) for setting in settings for dim in dimensions]
+    wide = wide[columns].astype(SCORE_DTYPE)
+    wide.columns = [f"{dim}{SETTING_SUFFIXES[setting]}" for dim, setting in columns]
+    return wide.reset_index()
+
+def merge_long_annotations(original_path, long_path, dimensions=None, usecols=None):
+    """
+    Merge the original annotations with a long-format result table and compute
+    bias commentary. Produces the same columns as merge_annotations, joined on
+    argQ_id with a single pivot instead of three composite-key merges.
+
+    Parameters:
+        original_path (str): Path to the original annotations CSV.
+        long_path (str): Path to the long-format results (.csv, .jsonl or .parquet).
+        dimensions (list): List of annotation dimensions. Defaults to
+                           ["SPECIFIC", "PERSUASIVE", "STRONG", "OBJECTIVE"].
+        usecols (list): Columns to load from the original file. Defaults to
+                        ['argQ_id', 'claim_text', 'premise_texts'] + dimensions.
+    """
+    if dimensions is None:
+        dimensions = ["SPECIFIC", "PERSUASIVE", "STRONG", "OBJECTIVE"]
+    if usecols is None:
+        usecols = ['argQ_id', 'claim_text', 'premise_texts'] + dimensions
+
+    df_orig = load_results(original_path, columns=usecols).drop_duplicates(subset='argQ_id')
+    df_orig = rename_annotation_columns(df_orig, dimensions, '_orig')
+
+    long_columns = ['argQ_id', 'setting'] + dimensions
+    long_df = load_results(long_path, columns=long_columns)
+
+    merged = df_orig.merge(pivot_settings(long_df, dimensions), on='argQ_id', how='inner')
+    return compute_bias(merged, dimensions)
@@ -0,0 +1,594 @@
+"""
+
+This module provides a concurrent annotation engine:
+ Schedule every (row, run) call of annotate_dataframe on a bounded worker pool,
+ throttle it with token-bucket rate limits and return the rows in input order.
+ Failed calls are retried with backoff while the pool shrinks under 429/5xx
+ pressure; runs that are finally lost are kept in a FailureLedger. An optional
+ Telemetry collector records every call and draws the progress line.
+
+"""
+
+import asyncio
+import contextlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.annotation import (
+    SETTINGS, Annotator, build_long_frame, build_packed_prompt, build_payload, build_prompt,
+    build_results_frame_from_array,
+    complete_scores, packed_max_tokens, parse_complete_annotation, parse_complete_packed_annotation,
+    run_scores_to_array, setting_name
+)
+from src.prompts import BudgetExceededError, estimate_payload_tokens, estimate_tokens, expected_completion_tokens
+from src.retry import AdaptiveConcurrency, FailureLedger, RetryPolicy, is_abort, is_throttle
+
+
+def estimate_request_tokens(prompt, max_tokens):
+    """Worst-case token cost of one request for the TPM limiter: prompt estimate plus the completion limit."""
+    return estimate_tokens(prompt) + max_tokens
+
+
+class TokenBucket:
+    """
+    Token bucket refilled continuously at `rate_per_minute`.
+
+    acquire(amount) waits until `amount` tokens are available and takes them.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        # A single request larger than the bucket can never fit; let it through once the bucket is full.
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits; either may be None (unlimited)."""
+
+    def __init__(self, rpm=None, tpm=None):
+        self.requests = TokenBucket(rpm) if rpm else None
+        self.tokens = TokenBucket(tpm) if tpm else None
+
+    async def acquire(self, token_cost):
+        if self.requests is not None:
+            await self.requests.acquire(1)
+        if self.tokens is not None:
+            await self.tokens.acquire(token_cost)
+
+
+class AnnotationEngine:
+    """
+    Scheduling state shared by every call of a run: the worker threads, the
+    adaptive concurrency limit, the rate limiter, the retry policy and the
+    failure ledger. Create it inside the running event loop and close() it
+    when the run is over.
+
+    Parameters:
+        annotator (Annotator): Client used for every call.
+        concurrency (int): Upper bound of requests in flight; the live limit drops
+                           below it while the provider answers 429/5xx.
+        retry_policy (RetryPolicy): Backoff for retryable errors (default: RetryPolicy()).
+        ledger (FailureLedger): Where lost runs are recorded (default: a new one, as self.ledger).
+        budget (TokenBudget): Checked before every attempt and charged with its estimated tokens
+                              (as in --estimate_only) once the API answered it; the run stops
+                              with BudgetExceededError once it is spent. Cache hits are free.
+        total (int): Number of rows expected, for progress messages (optional).
+        telemetry (Telemetry): Records every call; replaces the per-row progress prints.
+        adaptive (AdaptiveRuns): Early stopping: min_runs runs per prompt, then one more at a
+                                 time until they agree or max_runs is reached (`runs` is ignored).
+        pack_size (int): Arguments scored per request under one shared rubric (text answers);
+                         arguments a packed answer does not fully score are requested singly.
+    """
+
+    def __init__(self, annotator, runs=3, prompt_type="unbiased", bias_type="female",
+                 concurrency=8, rpm=None, tpm=None, retry_policy=None, ledger=None, budget=None, total=None,
+                 telemetry=None, adaptive=None, pack_size=1):
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        if pack_size < 1:
+            raise ValueError("pack_size must be at least 1")
+        if pack_size > 1 and adaptive is not None:
+            raise ValueError("packed requests do not support adaptive runs")
+        self.annotator = annotator
+        self.adaptive = adaptive
+        self.runs = adaptive.max_runs if adaptive is not None else runs
+        self.prompt_type = prompt_type
+        self.bias_type = bias_type
+        self.limiter = RateLimiter(rpm=rpm, tpm=tpm)
+        self.controller = AdaptiveConcurrency(concurrency)
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.ledger = ledger if ledger is not None else FailureLedger()
+        self.budget = budget
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+        self.total = total
+        self.telemetry = telemetry
+        self.pack_size = pack_size
+        self.completed = 0
+        self.fallbacks = 0
+
+    async def call_annotator(self, prompt, bias_mode, run_index, trace=None, max_tokens=None, response_format=None,
+                             refresh=False, budget_tokens=None):
+        """
+        One API call inside a concurrency slot; returns (content, error). With
+        `budget_tokens` (prompt, completion), the budget is checked before the call
+        and charged with them if the API answered it (not the cache).
+        """
+        queued = time.perf_counter()
+        await self.controller.acquire()
+        try:
+            if budget_tokens is not None:
+                self.budget.check(*budget_tokens)
+            try:
+                await self.limiter.acquire(estimate_request_tokens(prompt, max_tokens or self.annotator.max_tokens))
+                if trace is not None:
+                    trace["queue_wait"] = time.perf_counter() - queued
+                content = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.annotator.annotate, prompt, bias_mode, run_index, trace, max_tokens,
+                    response_format, refresh
+                )
+            finally:
+                if budget_tokens is not None and trace is not None and trace.get("outcome") == "ok":
+                    self.budget.charge(*budget_tokens)
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            return None, e
+        finally:
+            await self.controller.release()
+        self.controller.record_success()
+        return content, None
+
+    def record_call(self, trace, argQ_id, setting, run_index, attempt, error=None, parse_ok=None):
+        if self.telemetry is None:
+            return
+        if error is not None and trace.get("outcome") is None:
+            trace["outcome"] = "error"
+        self.telemetry.record(
+            **trace, model=self.annotator.model, argQ_id=argQ_id, setting=setting, run=run_index,
+            attempt=attempt, parse_ok=parse_ok, error=str(error) if error is not None else None
+        )
+
+    async def request(self, prompt, bias_mode, run_index, argQ_id=None, setting=None, parse=None,
+                      max_tokens=None, completion_tokens=None, response_format=None):
+        """
+        Send one prompt, retrying retryable errors, and parse the answer with `parse`
+        (default: parse_complete_annotation). Answers `parse` rejects with
+        UnparseableAnswerError are retried like transient errors, bypassing the cache.
+        Returns (parsed, None, attempt) or (None, error, attempt).
+        """
+        response_format = response_format or self.annotator.response_format
+        if parse is None:
+            parse = lambda annotation: parse_complete_annotation(annotation, response_format)
+        if completion_tokens is None:
+            completion_tokens = expected_completion_tokens(response_format)
+        budget_tokens = None
+        if self.budget is not None:
+            budget_tokens = (estimate_payload_tokens(build_payload(
+                prompt, self.annotator.model, self.annotator.temperature, bias_mode, response_format,
+                max_tokens if max_tokens is not None else self.annotator.max_tokens
+            )), completion_tokens)
+        attempt = 0
+        while True:
+            # Always traced: the outcome tells answered calls from cache hits for the budget.
+            trace = {}
+            annotation, error = await self.call_annotator(
+                prompt, bias_mode, run_index, trace, max_tokens, response_format, refresh=attempt > 0,
+                budget_tokens=budget_tokens
+            )
+            if error is None:
+                try:
+                    with self.stage("parse"):
+                        parsed = parse(annotation)
+                except Exception as e:
+                    error = e
+                else:
+                    self.record_call(trace, argQ_id, setting, run_index, attempt, parse_ok=True)
+                    return parsed, None, attempt
+                self.record_call(trace, argQ_id, setting, run_index, attempt, error, parse_ok=False)
+            else:
+                self.record_call(trace, argQ_id, setting, run_index, attempt, error)
+            if is_abort(error):
+                raise error
+            if is_throttle(error):
+                self.controller.record_throttle()
+            if attempt >= self.retry_policy.max_retries or not self.retry_policy.is_retryable(error):
+                return None, error, attempt
+            # Back off outside the concurrency slot so other calls keep the pool busy.
+            await asyncio.sleep(self.retry_policy.delay(attempt, error))
+            attempt += 1
+
+    async def annotate_run(self, prompt, bias_mode, run_index, argQ_id=None, setting=None):
+        scores, error, attempt = await self.request(prompt, bias_mode, run_index, argQ_id, setting)
+        if error is None:
+            return scores
+        print(f"Run {run_index+1} failed: {error}")
+        self.ledger.record(argQ_id, setting, run_index, attempt + 1, error)
+        return {}
+
+    async def annotate_packed_run(self, rows, setting, run_index):
+        """
+        One run of several rows in a single packed request; rows whose scores the
+        answer does not hold in full fall back to a single-argument request.
+        Returns one run score dict per row.
+        """
+        prompt_type, bias_type = SETTINGS[setting]
+        prompt, bias_mode = build_packed_prompt(rows, prompt_type, bias_type)
+        items, error, _ = await self.request(
+            prompt, bias_mode, run_index, ",".join(str(row['argQ_id']) for row in rows), setting,
+            parse=lambda annotation: parse_complete_packed_annotation(annotation, len(rows)),
+            max_tokens=packed_max_tokens(len(rows)),
+            completion_tokens=len(rows) * expected_completion_tokens("text"), response_format="text"
+        )
+        items = items or [{} for _ in rows]
+        fallback = [i for i, scores in enumerate(items) if not complete_scores(scores)]
+        self.fallbacks += len(fallback)
+        singles = await asyncio.gather(*(
+            self.annotate_run(*build_prompt(rows[i], prompt_type, bias_type), run_index, rows[i]['argQ_id'], setting)
+            for i in fallback
+        ))
+        for i, scores in zip(fallback, singles):
+            items[i] = scores
+        return items
+
+    async def annotate_packed_rows(self, rows, settings):
+        """Every setting x run of a chunk of rows; returns, per row, one run list per setting."""
+        results = await asyncio.gather(*(
+            self.annotate_packed_run(rows, setting, run_index)
+            for setting in settings for run_index in range(self.runs)
+        ))
+        chunk_runs = [
+            [[results[s * self.runs + r][i] for r in range(self.runs)] for s in range(len(settings))]
+            for i in range(len(rows))
+        ]
+        for _ in rows:
+            self.report_row()
+        return chunk_runs
+
+    async def annotate_packed(self, df, settings):
+        rows = [row for _, row in df.iterrows()]
+        chunks = await asyncio.gather(*(
+            self.annotate_packed_rows(rows[start:start + self.pack_size], settings)
+            for start in range(0, len(rows), self.pack_size)
+        ))
+        return [row_runs for chunk in chunks for row_runs in chunk]
+
+    async def annotate_prompt_runs(self, prompt, bias_mode, argQ_id=None, setting=None):
+        """Score `prompt` self.runs times (or adaptively); returns the run score dicts in run order."""
+        if self.adaptive is None:
+            return await asyncio.gather(
+                *(self.annotate_run(prompt, bias_mode, i, argQ_id, setting) for i in range(self.runs))
+            )
+        run_scores = list(await asyncio.gather(
+            *(self.annotate_run(prompt, bias_mode, i, argQ_id, setting) for i in range(self.adaptive.min_runs))
+        ))
+        while not self.adaptive.done(run_scores):
+            run_scores.append(await self.annotate_run(prompt, bias_mode, len(run_scores), argQ_id, setting))
+        return run_scores
+
+    def report_row(self):
+        self.completed += 1
+        if self.telemetry is not None:
+            self.telemetry.row_done()
+        elif self.total:
+            print(f"Annotated argument {self.completed}/{self.total}")
+        else:
+            print(f"Annotated argument {self.completed}")
+
+    async def annotate_row(self, row):
+        prompt, bias_mode = build_prompt(row, self.prompt_type, self.bias_type)
+        run_scores = await self.annotate_prompt_runs(
+            prompt, bias_mode, row['argQ_id'], setting_name(self.prompt_type, self.bias_type)
+        )
+        self.report_row()
+        return run_scores
+
+    async def annotate_row_settings(self, row, settings):
+        """Schedule every setting x run of one row together; returns one run list per setting."""
+        prompts = [build_prompt(row, *SETTINGS[setting]) for setting in settings]
+        setting_runs = await asyncio.gather(*(
+            self.annotate_prompt_runs(prompt, bias_mode, row['argQ_id'], setting)
+            for setting, (prompt, bias_mode) in zip(settings, prompts)
+        ))
+        self.report_row()
+        return setting_runs
+
+    async def annotate_frame(self, df):
+        if self.pack_size > 1:
+            setting = setting_name(self.prompt_type, self.bias_type)
+            all_run_scores = [row_runs[0] for row_runs in await self.annotate_packed(df, [setting])]
+        else:
+            all_run_scores = await asyncio.gather(*(self.annotate_row(row) for _, row in df.iterrows()))
+        with self.stage("aggregate"):
+            scores, valid = run_scores_to_array(all_run_scores, self.runs)
+            n_runs = [len(run_scores) for run_scores in all_run_scores] if self.adaptive is not None else None
+            return build_results_frame_from_array(df, scores, valid, n_runs)
+
+    async def annotate_long_frame(self, df, settings):
+        if self.pack_size > 1:
+            all_setting_runs = await self.annotate_packed(df, settings)
+        else:
+            all_setting_runs = await asyncio.gather(
+                *(self.annotate_row_settings(row, settings) for _, row in df.iterrows())
+            )
+        with self.stage("aggregate"):
+            return build_long_frame(df, settings, all_setting_runs)
+
+    def stage(self, name):
+        return self.telemetry.stage(name) if self.telemetry is not None else contextlib.nullcontext()
+
+    def close(self):
+        self.executor.shutdown()
+
+
+async def annotate_dataframe_async(
+    df,
+    model,
+    api_endpoint,
+    api_key,
+    temperature,
+    runs=3,
+    prompt_type="unbiased",
+    bias_type="female",
+    concurrency=8,
+    rpm=None,
+    tpm=None,
+    annotator=None,
+    cache=None,
+    retry_policy=None,
+    ledger=None,
+    response_format="text",
+    max_tokens=None,
+    budget=None,
+    telemetry=None,
+    adaptive=None,
+    pack_size=1
+):
+    """
+    Asynchronous counterpart of annotate_dataframe.
+
+    All `len(df) * runs` calls share one pool of `concurrency` workers and the
+    optional `rpm`/`tpm` limits. The returned DataFrame is identical in layout
+    and row order to the one produced by annotate_dataframe.
+
+    Pass an existing `annotator` to share its connection pool across several
+    calls; otherwise one is created with a pool of `concurrency` connections
+    and the optional response `cache`, asking for `response_format` answers.
+    """
+    results = []
+    await annotate_batches_async(
+        [df], results.append, model, api_endpoint, api_key, temperature,
+        runs=runs, prompt_type=prompt_type, bias_type=bias_type, concurrency=concurrency,
+        rpm=rpm, tpm=tpm, annotator=annotator, cache=cache, total=len(df),
+        retry_policy=retry_policy, ledger=ledger, response_format=response_format,
+        max_tokens=max_tokens, budget=budget, telemetry=telemetry, adaptive=adaptive,
+        pack_size=pack_size
+    )
+    return results[0]
+
+
+async def annotate_batches_async(
+    batches,
+    on_batch,
+    model,
+    api_endpoint,
+    api_key,
+    temperature,
+    runs=3,
+    prompt_type="unbiased",
+    bias_type="female",
+    concurrency=8,
+    rpm=None,
+    tpm=None,
+    annotator=None,
+    cache=None,
+    total=None,
+    settings=None,
+    retry_policy=None,
+    ledger=None,
+    response_format="text",
+    max_tokens=None,
+    budget=None,
+    telemetry=None,
+    adaptive=None,
+    pack_size=1
+):
+    """
+    Annotate an iterable of DataFrame batches and hand each result frame to
+    `on_batch` in input order, as soon as the batch is complete.
+
+    With `settings` (a list of SETTINGS labels), `prompt_type`/`bias_type` are
+    ignored: every setting x run of a row is scheduled on the shared pool and
+    each batch is returned as a long-format frame (see build_long_frame).
+
+    With `adaptive` (AdaptiveRuns), each prompt gets between min_runs and max_runs
+    runs and wide result frames gain an n_runs column. With `pack_size` > 1, that
+    many rows share one request per setting and run (see AnnotationEngine).
+
+    The next batch is scheduled while the current one finishes, so at most two
+    batches are held in memory and the worker pool stays busy between batches.
+    """
+    owns_annotator = annotator is None
+    if owns_annotator:
+        annotator = Annotator(
+            model, api_endpoint, api_key, temperature, pool_size=concurrency, cache=cache,
+            response_format=response_format, max_tokens=max_tokens
+        )
+    engine = AnnotationEngine(
+        annotator, runs=runs, prompt_type=prompt_type, bias_type=bias_type,
+        concurrency=concurrency, rpm=rpm, tpm=tpm, retry_policy=retry_policy, ledger=ledger, budget=budget,
+        total=total, telemetry=telemetry, adaptive=adaptive,
+        pack_size=pack_size
+    )
+    pending = None
+    try:
+        for batch in batches:
+            if settings:
+                task = asyncio.create_task(engine.annotate_long_frame(batch, settings))
+            else:
+                task = asyncio.create_task(engine.annotate_frame(batch))
+            if pending is not None:
+                on_batch(await pending)
+            pending = task
+        if pending is not None:
+            on_batch(await pending)
+            pending = None
+    finally:
+        if pending is not None:
+            pending.cancel()
+        engine.close()
+        if owns_annotator:
+            annotator.close()
+
+
+async def annotate_settings_async(
+    df,
+    model,
+    api_endpoint,
+    api_key,
+    temperature,
+    settings=("unbiased", "female", "male"),
+    runs=3,
+    concurrency=8,
+    rpm=None,
+    tpm=None,
+    annotator=None,
+    cache=None,
+    retry_policy=None,
+    ledger=None,
+    response_format="text",
+    max_tokens=None,
+    budget=None,
+    telemetry=None,
+    adaptive=None,
+    pack_size=1
+):
+    """
+    Annotate `df` under several prompt settings in one pass and return the
+    long-format table keyed by (argQ_id, setting, run).
+    """
+    results = []
+    await annotate_batches_async(
+        [df], results.append, model, api_endpoint, api_key, temperature,
+        runs=runs, concurrency=concurrency, rpm=rpm, tpm=tpm,
+        annotator=annotator, cache=cache, total=len(df), settings=list(settings),
+        retry_policy=retry_policy, ledger=ledger, response_format=response_format,
+        max_tokens=max_tokens, budget=budget, telemetry=telemetry, adaptive=adaptive,
+        pack_size=pack_size
+    )
+    return results[0]
+
+
+async def annotate_models_async(
+    batches,
+    on_batch,
+    annotators,
+    runs=3,
+    prompt_type="unbiased",
+    bias_type="female",
+    settings=None,
+    concurrency=None,
+    rate_limits=None,
+    done_ids=None,
+    retry_policy=None,
+    ledgers=None,
+    budget=None,
+    total=None,
+    telemetry=None,
+    adaptive=None,
+    pack_size=1
+):
+    """
+    Fan every batch out to several models at once: the data is read a single
+    time and each model's result frame goes to `on_batch(model, frame)`.
+
+    Parameters:
+        annotators (dict): {model: Annotator or EndpointPool}; each model gets an engine of its own.
+        concurrency (dict): {model: requests in flight} (default 8), e.g. an EndpointPool's concurrency.
+        rate_limits (dict): {model: (rpm, tpm)} (optional).
+        done_ids (dict): {model: argQ_ids} already annotated for that model (resume).
+        ledgers (dict): {model: FailureLedger} (optional).
+    """
+    concurrency = concurrency or {}
+    rate_limits = rate_limits or {}
+    done_ids = {model: set(ids) for model, ids in (done_ids or {}).items()}
+    ledgers = ledgers or {}
+    engines = {
+        model: AnnotationEngine(
+            annotator, runs=runs, prompt_type=prompt_type, bias_type=bias_type,
+            concurrency=concurrency.get(model, 8), rpm=rate_limits.get(model, (None, None))[0],
+            tpm=rate_limits.get(model, (None, None))[1], retry_policy=retry_policy, ledger=ledgers.get(model),
+            budget=budget, total=total, telemetry=telemetry, adaptive=adaptive, pack_size=pack_size
+        )
+        for model, annotator in annotators.items()
+    }
+
+    async def annotate_batch(batch):
+        jobs = {}
+        for model, engine in engines.items():
+            todo = batch
+            if done_ids.get(model):
+                todo = batch[~batch['argQ_id'].astype(str).isin(done_ids[model])]
+            if len(todo):
+                jobs[model] = engine.annotate_long_frame(todo, settings) if settings else engine.annotate_frame(todo)
+        frames = await asyncio.gather(*jobs.values())
+        return list(zip(jobs, frames))
+
+    def deliver(results):
+        for model, frame in results:
+            on_batch(model, frame)
+
+    pending = None
+    try:
+        for batch in batches:
+            task = asyncio.create_task(annotate_batch(batch))
+            if pending is not None:
+                deliver(await pending)
+            pending = task
+        if pending is not None:
+            deliver(await pending)
+            pending = None
+    finally:
+        if pending is not None:
+            pending.cancel()
+        for engine in engines.values():
+            engine.close()
+
+
+def annotate_dataframe_concurrent(*args, **kwargs):
+    """Blocking wrapper around annotate_dataframe_async (inside Jupyter, await the coroutine instead)."""
+    return asyncio.run(annotate_dataframe_async(*args, **kwargs))
+
+
+def annotate_settings_concurrent(*args, **kwargs):
+    """Blocking wrapper around annotate_settings_async."""
+    return asyncio.run(annotate_settings_async(*args, **kwargs))
+
+
+def annotate_batches_concurrent(*args, **kwargs):
+    """Blocking wrapper around annotate_batches_async."""
+    return asyncio.run(annotate_batches_async(*args, **kwargs))
+
+
+def annotate_models_concurrent(*args, **kwargs):
+    """Blocking wrapper around annotate_models_async."""
+    return asyncio.run(annotate_models_async(*args, **kwargs))
@@ -0,0 +1,100 @@
+"""
+
+This module provides an offline batch mode for annotation:
+ Phase one writes one chat-completion request per (argQ_id, setting, run) to a
+ batch-request JSONL; phase two reads the provider's batch-results JSONL and
+ builds the same DataFrame that annotate_dataframe returns.
+
+"""
+
+import json
+
+from src.annotation import build_payload, build_prompt, build_results_frame, parse_complete_annotation, setting_name
+
+BATCH_URL = "/v1/chat/completions"
+
+
+def make_custom_id(argQ_id, setting, run_index):
+    return f"{argQ_id}|{setting}|{run_index}"
+
+
+def split_custom_id(custom_id):
+    argQ_id, setting, run_index = custom_id.rsplit("|", 2)
+    return argQ_id, setting, int(run_index)
+
+
+def build_batch_requests(df, output_path, model, temperature, runs=3, prompt_type="unbiased",
+                         bias_type="female", url=BATCH_URL, response_format="text", max_tokens=None):
+    """
+    Write the batch-request JSONL for `df` and return the number of requests.
+
+    Each line carries the same payload get_annotation would POST, under a stable
+    custom_id "<argQ_id>|<setting>|<run>".
+    """
+    setting = setting_name(prompt_type, bias_type)
+    seen = set()
+    count = 0
+    with open(output_path, "w", encoding="utf-8") as f:
+        for _, row in df.iterrows():
+            if row['argQ_id'] in seen:
+                raise ValueError(f"Duplicate argQ_id {row['argQ_id']}: custom_ids would not be unique")
+            seen.add(row['argQ_id'])
+            prompt, bias_mode = build_prompt(row, prompt_type, bias_type)
+            body = build_payload(prompt, model, temperature, bias_mode, response_format, max_tokens)
+            for run_index in range(runs):
+                request = {
+                    "custom_id": make_custom_id(row['argQ_id'], setting, run_index),
+                    "method": "POST",
+                    "url": url,
+                    "body": body,
+                }
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+                count += 1
+    return count
+
+
+def read_batch_results(results_path):
+    """
+    Map each custom_id of a batch-results JSONL to the returned message content.
+    Failed requests map to None.
+    """
+    contents = {}
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                contents[result["custom_id"]] = None
+                continue
+            contents[result["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    return contents
+
+
+def assemble_batch_results(df, results_path, runs=3, prompt_type="unbiased", bias_type="female",
+                           response_format="text"):
+    """
+    Build the annotate_dataframe result frame for `df` from a batch-results JSONL.
+
+    Missing, failed or unparseable runs are dropped from the run lists, as
+    get_multiple_annotations does for failed calls.
+    """
+    setting = setting_name(prompt_type, bias_type)
+    contents = read_batch_results(results_path)
+    all_annotation_runs = []
+    for _, row in df.iterrows():
+        annotations = {"Strength": [], "Specificity": [], "Persuasiveness": [], "Objectivity": []}
+        for run_index in range(runs):
+            custom_id = make_custom_id(row['argQ_id'], setting, run_index)
+            try:
+                content = contents.get(custom_id)
+                if content is None:
+                    raise KeyError(f"no successful result for {custom_id}")
+                scores = parse_complete_annotation(content, response_format)
+                for dimension, score in scores.items():
+                    annotations[dimension].append(score)
+            except Exception as e:
+                print(f"Run {run_index+1} failed: {e}")
+        all_annotation_runs.append(annotations)
+    return build_results_frame(df, all_annotation_runs)
@@ -1,34 +1,157 @@
 import numpy as np
 import pandas as pd
 
-def compute_mbe(df_without_bias, df_with_bias, dimensions=['STRONG', 'SPECIFIC', 'PERSUASIVE', 'OBJECTIVE']):
+DEFAULT_DIMENSIONS = ['STRONG', 'SPECIFIC', 'PERSUASIVE', 'OBJECTIVE']
+METRICS = ["Mean Bias Error", "Mean Absolute Error", "MAPE (%)"]
+
+
+def align_scores(df_without_bias, df_with_bias, dimensions, key='argQ_id', extra_columns=()):
+    """
+    Align two result frames and return (base, biased, extra): two (n x d) float
+    score matrices and a frame with `extra_columns` from df_without_bias.
+
+    Rows are matched on `key` when both frames have it (duplicates keep their
+    first row), otherwise on the index as plain pandas arithmetic would.
+    """
+    columns = list(dimensions)
+    if key in df_without_bias.columns and key in df_with_bias.columns:
+        left = df_without_bias.drop_duplicates(subset=key)
+        right = df_with_bias.drop_duplicates(subset=key)
+        positions = pd.Index(right[key]).get_indexer(left[key])
+        left = left[positions >= 0]
+        right = right.iloc[positions[positions >= 0]]
+    else:
+        index = df_without_bias.index.intersection(df_with_bias.index, sort=False)
+        left = df_without_bias.loc[index]
+        right = df_with_bias.loc[index]
+    base = left[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+    biased = right[columns].to_numpy(dtype=np.float64, na_value=np.nan)
+    return base, biased, left[list(extra_columns)].reset_index(drop=True)
+
+
+def metric_matrix(base, biased):
+    """
+    Per-row contributions of every metric, side by side: signed deltas,
+    absolute deltas and absolute percentage errors (NaN where base is 0),
+    as one (n x 3d) matrix whose column means are MBE, MAE and MAPE.
+    """
+    deltas = biased - base
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ape = np.abs(deltas) / np.where(base == 0, np.nan, base) * 100
+    return np.hstack([deltas, np.abs(deltas), ape])
+
+
+def bootstrap_means(values, n_boot=2000, random_state=42, max_cells=4_000_000):
+    """
+    Column nan-means of `values` (n x k) for `n_boot` bootstrap resamples.
+
+    Each resample is expressed as a row of multiplicity counts, so a chunk of
+    resamples is one matrix product; chunks keep memory near `max_cells`.
+    Returns an (n_boot x k) array.
+    """
+    rng = np.random.default_rng(random_state)
+    n = len(values)
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0.0)
+    chunk = max(1, max_cells // max(n, 1))
+    means = np.empty((n_boot, values.shape[1]))
+    for start in range(0, n_boot, chunk):
+        size = min(chunk, n_boot - start)
+        draws = rng.integers(0, n, size=(size, n))
+        offsets = (np.arange(size) * n)[:, None]
+        weights = np.bincount((draws + offsets).ravel(), minlength=size * n).reshape(size, n).astype(np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            means[start:start + size] = (weights @ filled) / (weights @ valid)
+    return means
+
+
+def _report_block(base, biased, dimensions, n_boot, ci, random_state):
+    values = metric_matrix(base, biased)
+    with np.errstate(invalid="ignore"):
+        point = np.nanmean(values, axis=0) if len(values) else np.full(values.shape[1], np.nan)
+    d = len(dimensions)
+    deltas = values[:, :d]
+    report = pd.DataFrame(index=pd.Index(dimensions, name="dimension"))
+    report["n"] = (~np.isnan(deltas)).sum(axis=0)
+    report["Share positive"] = (deltas > 0).sum(axis=0) / np.maximum(report["n"].to_numpy(), 1)
+    report["Share negative"] = (deltas < 0).sum(axis=0) / np.maximum(report["n"].to_numpy(), 1)
+    if n_boot and len(values):
+        with np.errstate(invalid="ignore"):
+            boot = bootstrap_means(values, n_boot=n_boot, random_state=random_state)
+            low, high = np.nanpercentile(boot, [(1 - ci) / 2 * 100, (1 + ci) / 2 * 100], axis=0)
+    for m, metric in enumerate(METRICS):
+        report[metric] = point[m * d:(m + 1) * d]
+        if n_boot and len(values):
+            report[f"{metric} low"] = low[m * d:(m + 1) * d]
+            report[f"{metric} high"] = high[m * d:(m + 1) * d]
+    return report
+
+
+def bias_report(df_without_bias, df_with_bias, dimensions=DEFAULT_DIMENSIONS, n_boot=2000, ci=0.95,
+                by=None, random_state=42, key='argQ_id', return_deltas=False):
+    """
+    MBE, MAE and MAPE of every dimension in one pass, with bootstrap
+    confidence intervals and the share of rows shifted up or down.
+
+    Parameters:
+        df_without_bias, df_with_bias (pd.DataFrame): Result frames, aligned on `key`.
+        n_boot (int): Bootstrap resamples (0 disables the intervals).
+        ci (float): Confidence level of the percentile intervals.
+        by (str): Optional column of df_without_bias (e.g. 'company_name') for
+                  a per-group breakdown; the overall rows are labelled "ALL".
+        return_deltas (bool): Also return the signed per-row deltas (biased - unbiased).
+    Returns:
+        pd.DataFrame indexed by dimension (or by (group, dimension) when `by` is set),
+        or (report, deltas) with return_deltas.
+    """
+    extra_columns = [c for c in (key, by) if c and c in df_without_bias.columns]
+    base, biased, extra = align_scores(
+        df_without_bias, df_with_bias, dimensions, key=key, extra_columns=extra_columns
+    )
+    report = _report_block(base, biased, dimensions, n_boot, ci, random_state)
+    if by is not None:
+        blocks = {"ALL": report}
+        codes, groups = pd.factorize(extra[by], sort=True)
+        for g, group in enumerate(groups):
+            rows = codes == g
+            blocks[group] = _report_block(base[rows], biased[rows], dimensions, n_boot, ci, random_state)
+        report = pd.concat(blocks, names=[by])
+    if not return_deltas:
+        return report
+    deltas = pd.concat([extra, pd.DataFrame(biased - base, columns=list(dimensions))], axis=1)
+    return report, deltas
+
+
+def compute_mbe(df_without_bias, df_with_bias, dimensions=DEFAULT_DIMENSIONS):
     
-    mbe_scores = {}
-    for dimension in dimensions:
-        mbe = np.nanmean(df_with_bias[dimension] - df_without_bias[dimension])
-        mbe_scores[dimension] = mbe
-    return pd.DataFrame(mbe_scores, index=["Mean Bias Error"]).T
+    base, biased, _ = align_scores(df_without_bias, df_with_bias, dimensions)
+    mbe_scores = np.nanmean(biased - base, axis=0)
+    return pd.DataFrame([mbe_scores], columns=list(dimensions), index=["Mean Bias Error"]).T
 
-def compute_mae_bias(df_without_bias, df_with_bias, dimensions=['STRONG', 'SPECIFIC', 'PERSUASIVE', 'OBJECTIVE']):
+def compute_mae_bias(df_without_bias, df_with_bias, dimensions=DEFAULT_DIMENSIONS):
     
-    mae_scores = {}
-    for dimension in dimensions:
-        mae = np.mean(np.abs(df_without_bias[dimension] - df_with_bias[dimension]))
-        mae_scores[dimension] = mae
-    return pd.DataFrame(mae_scores, index=["Mean Absolute Error"]).T
+    base, biased, _ = align_scores(df_without_bias, df_with_bias, dimensions)
+    mae_scores = np.nanmean(np.abs(base - biased), axis=0)
+    return pd.DataFrame([mae_scores], columns=list(dimensions), index=["Mean Absolute Error"]).T
 
 
 
-def compute_mape(df_without_bias, df_with_bias, dimensions=['STRONG', 'SPECIFIC', 'PERSUASIVE', 'OBJECTIVE']):
+def compute_mape(df_without_bias, df_with_bias, dimensions=DEFAULT_DIMENSIONS):
     
-    mape_scores = {}
-    for dimension in dimensions:
-        
-        denominator = df_without_bias[dimension].replace(0, np.nan)
-        abs_percentage_errors = np.abs((df_without_bias[dimension] - df_with_bias[dimension]) / denominator)
-        mape = np.nanmean(abs_percentage_errors) * 100  
-        mape_scores[dimension] = mape
-    return pd.DataFrame(mape_scores, index=["MAPE (%)"]).T
+    base, biased, _ = align_scores(df_without_bias, df_with_bias, dimensions)
+    mape_scores = np.nanmean(metric_matrix(base, biased)[:, 2 * len(dimensions):], axis=0)
+    return pd.DataFrame([mape_scores], columns=list(dimensions), index=["MAPE (%)"]).T
+
+def summarize_deltas(delta_block):
+    """
+    Mean Bias Error and Mean Absolute Error per (setting, dimension) straight
+    from the delta block returned by annotation_delta_bias.compute_bias(..., return_deltas=True).
+    """
+    deltas = delta_block.to_numpy(dtype=np.float64)
+    return pd.DataFrame({
+        "Mean Bias Error": np.nanmean(deltas, axis=0),
+        "Mean Absolute Error": np.nanmean(np.abs(deltas), axis=0),
+    }, index=delta_block.columns)
 
 
 def save_bias_results_to_csv(results_df, filepath, model_name="", setting="", decimal_places=2):
@@ -0,0 +1,125 @@
+"""
+
+This module provides a persistent, content-addressed cache of LLM responses:
+ Responses are stored in SQLite under a hash of everything that determines them
+ (model, system message, prompt, temperature, max_tokens and run index).
+
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+class CacheMiss(KeyError):
+    """Raised by a read-only (replay) cache when a request has no stored response."""
+
+
+def make_cache_key(model, system_message, prompt, temperature, max_tokens, run_index):
+    material = json.dumps(
+        [model, system_message, prompt, temperature, max_tokens, run_index],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    On-disk response cache with least-recently-used, size-based eviction.
+
+    Parameters:
+        path (str): SQLite database file; created if missing.
+        max_bytes (int): Evict least recently used entries once stored responses exceed this size.
+                         None means unbounded.
+        read_only (bool): Replay mode. Lookups never touch the network; a miss raises CacheMiss
+                          and nothing is written or evicted.
+    """
+
+    def __init__(self, path, max_bytes=None, read_only=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.read_only = read_only
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " content TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses(last_access)")
+            self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """Return the stored response for `key`, or None (CacheMiss in read-only mode)."""
+        with self.lock:
+            row = self.conn.execute("SELECT content FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.read_only:
+                    raise CacheMiss(key)
+                return None
+            self.hits += 1
+            if not self.read_only:
+                self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+                self.conn.commit()
+            return row[0]
+
+    def put(self, key, content):
+        if self.read_only:
+            return
+        size = len(content.encode("utf-8"))
+        with self.lock:
+            previous = self.conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, content, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, content, size, time.time()),
+            )
+            self.total_bytes += size - (previous[0] if previous else 0)
+            if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        cursor = self.conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC")
+        stale = []
+        while self.total_bytes > self.max_bytes:
+            row = cursor.fetchone()
+            if row is None:
+                break
+            stale.append((row[0],))
+            self.total_bytes -= row[1]
+        cursor.close()
+        self.conn.executemany("DELETE FROM responses WHERE key = ?", stale)
+        self.evictions += len(stale)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size_bytes": self.total_bytes,
+        }
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,200 @@
+"""
+
+This module provides checkpointed output for long annotation runs:
+ Append finished rows to a CSV or JSONL file in flushed batches (or to a
+ Parquet directory, one part file per batch), and read an existing output
+ back to find which argQ_ids are already done.
+
+"""
+
+import io
+import json
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from src.annotation import DIMENSION_COLUMNS
+from src.result_io import output_format, results_to_table
+
+REQUIRED_COLUMNS = ['argQ_id', 'claim_text', 'premise_texts', 'company_name']
+
+
+def completed_ids(path):
+    """Return the set of argQ_ids (as strings) already written to `path` with their scores."""
+    score_columns = list(DIMENSION_COLUMNS.values())
+    if output_format(path) == "parquet":
+        if not parquet_parts(path):
+            return set()
+        names = pq.ParquetDataset(path).schema.names
+        results = pq.read_table(
+            path, columns=['argQ_id'] + [column for column in score_columns if column in names]
+        ).to_pandas()
+        return scored_ids(results)
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return set()
+    if output_format(path) == "csv":
+        with open(path, encoding="utf-8", newline="") as f:
+            text = complete_lines(f.read())
+        if not text:
+            return set()
+        return scored_ids(pd.read_csv(io.StringIO(text)))
+    done = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                argq_id = str(record['argQ_id'])
+            except (ValueError, KeyError):
+                # A line cut short by a crash mid-write; that row is annotated again.
+                continue
+            if not any(pd.isna(record[column]) for column in score_columns if column in record):
+                done.add(argq_id)
+    return done
+
+
+def scored_ids(results):
+    """argQ_ids of the rows of `results` holding every score; rows without scores are annotated again."""
+    score_columns = [column for column in DIMENSION_COLUMNS.values() if column in results.columns]
+    results = results.dropna(subset=score_columns)
+    return set(results['argQ_id'].astype(str))
+
+
+def complete_lines(text, quoted=True):
+    """
+    `text` up to its last complete line, without a final line cut short by a
+    crash. With `quoted` (CSV), newlines inside an open quoted field do not end
+    a line, so a row truncated mid-field is dropped as a whole.
+    """
+    quotes = text.count('"') if quoted else 0
+    cut = len(text)
+    while cut > 0:
+        if text[cut - 1] == "\n" and quotes % 2 == 0:
+            return text[:cut]
+        newline = text.rfind("\n", 0, cut - 1)
+        if quoted:
+            quotes -= text.count('"', newline + 1, cut)
+        cut = newline + 1
+    return ""
+
+
+def drop_partial_line(path, quoted=True):
+    """Truncate `path` after its last complete line so appended rows start on a line of their own."""
+    with open(path, encoding="utf-8", newline="") as f:
+        text = f.read()
+    complete = complete_lines(text, quoted)
+    if len(complete) < len(text):
+        with open(path, "rb+") as f:
+            f.truncate(len(complete.encode("utf-8")))
+
+
+def parquet_parts(path):
+    """Part files of a Parquet output: the file itself, or the .parquet files of a directory."""
+    if os.path.isfile(path):
+        return [path]
+    if not os.path.isdir(path):
+        return []
+    return sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".parquet"))
+
+
+def iter_pending_batches(data_path, batch_size, done_ids=()):
+    """
+    Read `data_path` in chunks of `batch_size` rows, drop incomplete rows and
+    rows whose argQ_id is in `done_ids`, and yield the non-empty remainder.
+    """
+    done_ids = set(done_ids)
+    for chunk in pd.read_csv(data_path, chunksize=batch_size):
+        chunk = chunk.dropna(subset=REQUIRED_COLUMNS)
+        if done_ids:
+            chunk = chunk[~chunk['argQ_id'].astype(str).isin(done_ids)]
+        if len(chunk):
+            yield chunk
+
+
+class ResultWriter:
+    """
+    Append result batches to a CSV or JSONL file, flushing each batch to disk.
+
+    A .parquet output is a directory with one part file per batch, each written
+    to a temporary name and renamed into place once complete, so a crash never
+    leaves a truncated part behind.
+
+    Parameters:
+        path (str): Output file; its extension selects the format.
+        append (bool): Keep existing content (resume) instead of truncating it.
+    """
+
+    def __init__(self, path, append=False):
+        self.path = path
+        self.format = output_format(path)
+        self.rows_written = 0
+        if self.format == "parquet":
+            self._open_parquet(append)
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if append and os.path.exists(path):
+            drop_partial_line(path, quoted=self.format == "csv")
+        has_content = append and os.path.exists(path) and os.path.getsize(path) > 0
+        self.write_header = not has_content
+        self.file = open(path, "a" if append else "w", encoding="utf-8", newline="")
+
+    def _open_parquet(self, append):
+        self.file = None
+        parts = parquet_parts(self.path)
+        if os.path.isfile(self.path):
+            if not append:
+                os.remove(self.path)
+            else:
+                # A single-file result (save_results) becomes the first part of the directory.
+                temporary = self.path + ".tmp"
+                os.replace(self.path, temporary)
+                os.makedirs(self.path)
+                os.replace(temporary, os.path.join(self.path, "part-00000.parquet"))
+                parts = parquet_parts(self.path)
+        elif not append:
+            for part in parts:
+                os.remove(part)
+            parts = []
+        os.makedirs(self.path, exist_ok=True)
+        self.schema = pq.read_schema(parts[0]) if parts else None
+        self.next_part = len(parts)
+
+    def _write_parquet(self, results_df):
+        table = results_to_table(results_df, self.schema)
+        if self.schema is None:
+            self.schema = table.schema
+        part = os.path.join(self.path, f"part-{self.next_part:05d}.parquet")
+        # Readers skip names starting with "_", so an interrupted write is never loaded.
+        temporary = os.path.join(self.path, f"_part-{self.next_part:05d}.tmp")
+        pq.write_table(table, temporary)
+        os.replace(temporary, part)
+        self.next_part += 1
+
+    def write(self, results_df):
+        if self.format == "parquet":
+            self._write_parquet(results_df)
+            self.rows_written += len(results_df)
+            return
+        if self.format == "csv":
+            text = results_df.to_csv(index=False, header=self.write_header)
+        else:
+            text = results_df.to_json(orient="records", lines=True, force_ascii=False)
+            if text and not text.endswith("\n"):
+                text += "\n"
+        self.file.write(text)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.write_header = False
+        self.rows_written += len(results_df)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,22 +1,38 @@
+import numpy as np
 import pandas as pd
-from sklearn.metrics import cohen_kappa_score
+
+from src.kappa import (
+    cohen_kappa_from_confusion, confusion_matrices, encode_ratings, factorize_ratings, n_categories_of
+)
 
 def compute_cohen_kappa(ground_truth_df, llm_results_df, dimensions):
    
-    cohen_kappa_results = {}
-
     for dim in dimensions:
         if dim not in ground_truth_df.columns or dim not in llm_results_df.columns:
             raise ValueError(f"Column {dim} is missing in either ground truth or LLM results")
 
-       
-        llm_ratings = llm_results_df[dim]
-        ground_truth_ratings = ground_truth_df[dim]
+    if len(llm_results_df) != len(ground_truth_df):
+        raise ValueError("Ground truth and LLM results must have the same number of rows")
 
-        # Calculate Cohen's Kappa 
-        cohen_kappa_results[dim] = cohen_kappa_score(llm_ratings, ground_truth_ratings)
-
-    return cohen_kappa_results
+    # One (dimensions x rows) matrix per rater, paired by position; rows missing a score are skipped.
+    # Numeric scores are used as codes, other labels are numbered over both raters' categories.
+    llm_ratings, ground_truth_ratings = [], []
+    for dim in dimensions:
+        llm, ground_truth = llm_results_df[dim], ground_truth_df[dim]
+        if pd.api.types.is_numeric_dtype(llm) and pd.api.types.is_numeric_dtype(ground_truth):
+            llm_codes, ground_truth_codes = encode_ratings(llm), encode_ratings(ground_truth)
+        else:
+            llm_codes, ground_truth_codes = factorize_ratings(llm, ground_truth)
+        llm_ratings.append(llm_codes)
+        ground_truth_ratings.append(ground_truth_codes)
+    llm_ratings = np.stack(llm_ratings)
+    ground_truth_ratings = np.stack(ground_truth_ratings)
+
+    # Calculate Cohen's Kappa for every dimension at once
+    n_categories = n_categories_of(llm_ratings, ground_truth_ratings)
+    kappas = cohen_kappa_from_confusion(confusion_matrices(llm_ratings, ground_truth_ratings, n_categories))
+
+    return {dim: np.float64(kappa) for dim, kappa in zip(dimensions, kappas)}
 
 
 def save_cohen_kappa_results_to_csv(cohen_kappa_results, filepath, model_name, setting, decimal_places=2):
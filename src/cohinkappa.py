@@ -2,64 +2,80 @@
 
 This module provides functions to:
  Sample 20% of the data from a set of specified companies (5% each).
+ Measure intra-model consistency as Cohen's kappa between annotation runs,
+ for one random pair of runs or for every pair at once.
 
 """
 
+import itertools
 import random
 import numpy as np
 import pandas as pd
-from sklearn.metrics import cohen_kappa_score
+
+from src.sampling import stratified_sample
+from src.kappa import cohen_kappa_from_confusion, confusion_matrices, n_categories_of, run_lists_to_codes
 
 
 def create_sample(df, specified_companies, fraction=0.20, random_state=42):
     
-    total_sample_size = int(len(df) * fraction)
-    sample_size_per_company = int(total_sample_size / len(specified_companies))
-
-    sample_df = pd.DataFrame()
-    for company in specified_companies:
-        company_data = df[df['company_name'] == company]
-        # Ensure reproducible sampling
-        sample = company_data.sample(n=sample_size_per_company, random_state=random_state)
-        sample_df = pd.concat([sample_df, sample], ignore_index=True)
-
-    return sample_df
-
-
-def compute_random_cohens_kappa(sample_df, dimensions, random_seed=42):
+    # Equal share per company, capped at the rows a company has (see sampling.stratified_sample)
+    return stratified_sample(
+        df, strata='company_name', fraction=fraction, allocation="equal",
+        include=specified_companies, random_state=random_state
+    )
+
+
+def complete_runs(sample_df, dim, runs=None):
+    """
+    Stack the run lists of `dim` into an (n x R) code array, with rows that do
+    not hold exactly R valid runs masked out. R defaults to the longest list.
+
+    With an n_runs column (adaptive runs), rows made different numbers of runs
+    and only the first min(n_runs) runs of every row were made regardless of
+    agreement: R is capped at that count and longer rows are cut to their first R runs.
+    """
+    codes = run_lists_to_codes(sample_df[dim])
+    if runs is None:
+        runs = codes.shape[1]
+    if 'n_runs' in sample_df.columns and len(sample_df):
+        runs = min(runs, int(sample_df['n_runs'].min()))
+        counts = (codes[:, :runs] >= 0).sum(axis=1)
+    else:
+        counts = (codes >= 0).sum(axis=1)
+    complete = (counts == runs) & (codes[:, :runs] >= 0).all(axis=1)
+    codes = codes[:, :runs].copy()
+    codes[~complete] = -1
+    return codes
+
+
+def pair_kappas(codes, pairs):
+    """Cohen's kappa of every (run_a, run_b) pair of an (n x R) code array, as one batch."""
+    if not pairs:
+        return np.array([])
+    first, second = np.array(pairs).T
+    n_categories = n_categories_of(codes)
+    return cohen_kappa_from_confusion(confusion_matrices(codes[:, first].T, codes[:, second].T, n_categories))
+
+
+def compute_random_cohens_kappa(sample_df, dimensions, random_seed=42, runs=3):
     
     random.seed(random_seed)
     kappa_results = {}
 
     for dim in dimensions:
-       
-        r1, r2 = random.sample([0, 1, 2], 2)
-
-        chosen_run_1 = []
-        chosen_run_2 = []
-
-        for _, row in sample_df.iterrows():
-            run_list = row[dim]
-            
-            if isinstance(run_list, list) and len(run_list) == 3:
-                chosen_run_1.append(run_list[r1])
-                chosen_run_2.append(run_list[r2])
-            else:
-                
-                chosen_run_1.append(np.nan)
-                chosen_run_2.append(np.nan)
-
-        
-        run1_series = pd.Series(chosen_run_1)
-        run2_series = pd.Series(chosen_run_2)
-
-      
-        valid_data = pd.concat([run1_series, run2_series], axis=1).dropna()
-        runA_values = valid_data.iloc[:, 0].astype(int)
-        runB_values = valid_data.iloc[:, 1].astype(int)
+
+        # Rows without exactly `runs` valid runs are skipped (see complete_runs for adaptive runs)
+        codes = complete_runs(sample_df, dim, runs)
+
+        if codes.shape[1] < 2:
+            print(f"{dim}: {codes.shape[1]} run(s) per row, at least 2 are needed for Cohen's Kappa.")
+            kappa_results[dim] = {'Chosen Runs': 'n/a', 'Kappa': np.nan}
+            continue
+
+        r1, r2 = random.sample(range(codes.shape[1]), 2)
 
         # Calculate Cohen's Kappa
-        kappa_value = cohen_kappa_score(runA_values, runB_values)
+        kappa_value = pair_kappas(codes, [(r1, r2)])[0]
 
         # Store results
         kappa_results[dim] = {
@@ -69,6 +85,40 @@ def compute_random_cohens_kappa(sample_df, dimensions, random_seed=42):
 
     return kappa_results
 
+
+def compute_run_pair_kappa(sample_df, dimensions, runs=None, n_pairs=None, random_seed=42):
+    """
+    Cohen's kappa for all R*(R-1)/2 pairs of runs (or a seeded random subset of
+    `n_pairs` of them) per dimension, summarized as mean, min and max agreement.
+
+    Parameters:
+        sample_df (pd.DataFrame): Rows whose `dimensions` columns hold run lists.
+        runs (int): Number of runs R per row; defaults to the longest run list.
+    Returns:
+        dict: {dim: {'Chosen Runs', 'Kappa' (mean), 'Min Kappa', 'Max Kappa'}},
+        accepted by save_kappa_results_to_csv.
+    """
+    rng = np.random.default_rng(random_seed)
+    kappa_results = {}
+
+    for dim in dimensions:
+        codes = complete_runs(sample_df, dim, runs)
+        pairs = list(itertools.combinations(range(codes.shape[1]), 2))
+        if n_pairs is not None and n_pairs < len(pairs):
+            chosen = np.sort(rng.choice(len(pairs), size=n_pairs, replace=False))
+            pairs = [pairs[i] for i in chosen]
+
+        kappas = pair_kappas(codes, pairs)
+        with np.errstate(invalid="ignore"):
+            kappa_results[dim] = {
+                'Chosen Runs': f'{len(pairs)} pairs of {codes.shape[1]} runs',
+                'Kappa': np.nanmean(kappas) if len(kappas) else np.nan,
+                'Min Kappa': np.nanmin(kappas) if len(kappas) else np.nan,
+                'Max Kappa': np.nanmax(kappas) if len(kappas) else np.nan,
+            }
+
+    return kappa_results
+
 def save_kappa_results_to_csv(kappa_results, filepath, model_name="", setting="", decimal_places=2):
     
     rows = []
@@ -76,16 +126,22 @@ def save_kappa_results_to_csv(kappa_results, filepath, model_name="", setting=""
         chosen_runs = data["Chosen Runs"]
         kappa_value = data["Kappa"]
 
-        rows.append({
+        row = {
             "Model Name": model_name,
             "Setting": setting,
             "Dimension": dim,
             "Chosen Runs": chosen_runs,
             "Kappa": round(kappa_value, decimal_places)
-        })
-
-   
-    df = pd.DataFrame(rows, columns=["Model Name", "Setting", "Dimension", "Chosen Runs", "Kappa"])
+        }
+        # Range of agreement across run pairs (compute_run_pair_kappa)
+        for key in ("Min Kappa", "Max Kappa"):
+            if key in data:
+                row[key] = round(data[key], decimal_places)
+        rows.append(row)
+
+    columns = ["Model Name", "Setting", "Dimension", "Chosen Runs", "Kappa"]
+    columns += [key for key in ("Min Kappa", "Max Kappa") if any(key in row for row in rows)]
+    df = pd.DataFrame(rows, columns=columns)
 
 
     df.to_csv(filepath, index=False)
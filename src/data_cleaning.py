@@ -1,38 +1,195 @@
 import pandas as pd
 import os
-import ast
-
-def is_valid_integer(value):
-    
-    try:
-        int(value)  
-        return True
-    except ValueError:
-        return False
-
-def clean_and_validate_data(input_path, output_path):
- 
-    
-    print(f"\nProcessing file: {input_path}")
+import glob
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+from src.annotation import DIMENSION_COLUMNS, VALID_SCORE_RANGES
+
+TARGET_COLUMNS = ['STRONG', 'SPECIFIC', 'PERSUASIVE', 'OBJECTIVE']
+# Valid score range per column (OBJECTIVE is 0-1, the others 0-2)
+SCORE_RANGES = {DIMENSION_COLUMNS[name]: bounds for name, bounds in VALID_SCORE_RANGES.items()}
+
+def default_report_path(output_path):
+    return os.path.splitext(output_path)[0] + "_validation.json"
+
+
+def new_dimension_report():
+    return {"missing": 0, "non_numeric": 0, "rounded": 0, "out_of_range": 0, "offending_ids": []}
+
+
+def clean_chunk(chunk, report, target_columns=TARGET_COLUMNS, id_column='argQ_id', max_ids=100):
+    """
+    Coerce the score columns of one chunk to rounded Int64 and add its
+    violations to the per-dimension counters in `report`.
+    """
+    ids = chunk[id_column].to_numpy() if id_column in chunk.columns else chunk.index.to_numpy()
+    for col in target_columns:
+        counts = report[col]
+        raw = chunk[col]
+        values = pd.to_numeric(raw, errors='coerce')
+        non_numeric = (values.isna() & raw.notna()).to_numpy()
+        rounded = values.round()
+        low, high = SCORE_RANGES.get(col, (0, 2))
+        present = rounded.notna().to_numpy()
+        out_of_range = present & ~rounded.between(low, high).to_numpy()
 
-    df = pd.read_csv(input_path)
+        counts["missing"] += int((~present & ~non_numeric).sum())
+        counts["non_numeric"] += int(non_numeric.sum())
+        counts["rounded"] += int((present & (rounded != values).to_numpy()).sum())
+        counts["out_of_range"] += int(out_of_range.sum())
+        room = max_ids - len(counts["offending_ids"])
+        if room > 0:
+            counts["offending_ids"] += ids[non_numeric | out_of_range][:room].tolist()
 
-    target_columns = ['STRONG', 'SPECIFIC', 'PERSUASIVE', 'OBJECTIVE']
+        chunk[col] = rounded.astype('Int64')
+    return chunk
 
-    df[target_columns] = df[target_columns].apply(pd.to_numeric, errors='coerce')
 
-   
-    df[target_columns] = df[target_columns].round().astype('Int64')
+def clean_and_validate_data(input_path, output_path, chunksize=100_000, report_path=None,
+                            id_column='argQ_id', max_ids=100):
+    """
+    Clean the score columns of a CSV chunk by chunk and write a validation report.
 
-    df.to_csv(output_path, index=False)
+    Scores are coerced to numbers and rounded to Int64 (unparseable values become
+    missing), as before; memory stays bounded by `chunksize` rows. Every column is
+    read as text, so the other columns are written back as they were and the
+    output does not depend on `chunksize` (pandas would infer dtypes per chunk).
+
+    Parameters:
+        report_path (str): JSON validation report; defaults to <output>_validation.json.
+        max_ids (int): Offending row ids (non-numeric or out-of-range scores) kept per dimension.
+    Returns:
+        dict: The validation report.
+    """
+    print(f"\nProcessing file: {input_path}")
+
+    if report_path is None:
+        report_path = default_report_path(output_path)
+    report = {
+        "input": input_path,
+        "output": output_path,
+        "rows": 0,
+        "ranges": {col: list(SCORE_RANGES[col]) for col in TARGET_COLUMNS},
+        "dimensions": {col: new_dimension_report() for col in TARGET_COLUMNS},
+    }
+
+    header = True
+    with open(output_path, "w", encoding="utf-8", newline="") as f:
+        for chunk in pd.read_csv(input_path, chunksize=chunksize, dtype=str):
+            chunk = clean_chunk(chunk, report["dimensions"], TARGET_COLUMNS, id_column, max_ids)
+            chunk.to_csv(f, index=False, header=header)
+            header = False
+            report["rows"] += len(chunk)
     print(f" Cleaned data saved to: {output_path}")
 
-    valid_integers = df[target_columns].applymap(lambda x: isinstance(x, int))
-    valid_ranges = df[target_columns].applymap(lambda x: x in [0, 1, 2])
-    missing_values = df[target_columns].isnull().sum()
+    report["valid"] = all(
+        counts["non_numeric"] == 0 and counts["out_of_range"] == 0 and counts["missing"] == 0
+        for counts in report["dimensions"].values()
+    )
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f" Validation report saved to: {report_path}")
+
+    return report
+
+
+def file_digest(path, block_size=1 << 20):
+    """SHA-256 of a file's content, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(manifest_path):
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, manifest_path):
+    temporary = manifest_path + ".tmp"
+    with open(temporary, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, default=str)
+    os.replace(temporary, manifest_path)
+
+
+def _clean_file(task):
+    input_path, output_path, chunksize = task
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    return clean_and_validate_data(input_path, output_path, chunksize=chunksize)
+
+
+def summarize_reports(reports):
+    """One row per file: rows, overall validity and the violation counts of every dimension."""
+    rows = []
+    for report in reports:
+        row = {"input": report["input"], "output": report["output"], "rows": report["rows"],
+               "valid": report["valid"], "skipped": report.get("skipped", False)}
+        for col, counts in report["dimensions"].items():
+            for name in ("missing", "non_numeric", "rounded", "out_of_range"):
+                row[f"{col}_{name}"] = counts[name]
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def clean_directory(pattern, output_dir, workers=None, chunksize=100_000, manifest_path=None,
+                    summary_path=None, force=False):
+    """
+    Clean every CSV matching the glob `pattern` in parallel and summarize the validation.
+
+    Outputs keep their path relative to the common directory of the inputs.
+    A manifest (default: <output_dir>/manifest.json) stores the content hash and
+    report of every cleaned file; unchanged files are skipped unless `force`.
+
+    Parameters:
+        workers (int): Worker processes (default: one per core).
+        summary_path (str): Summary CSV; defaults to <output_dir>/cleaning_summary.csv.
+    Returns:
+        pd.DataFrame: The summary table, one row per input file.
+    """
+    output_root = os.path.abspath(output_dir)
+    files = sorted(
+        path for path in glob.glob(pattern, recursive=True)
+        if os.path.isfile(path) and not os.path.abspath(path).startswith(output_root + os.sep)
+    )
+    if manifest_path is None:
+        manifest_path = os.path.join(output_dir, "manifest.json")
+    if summary_path is None:
+        summary_path = os.path.join(output_dir, "cleaning_summary.csv")
+    os.makedirs(output_dir, exist_ok=True)
+    if not files:
+        print(f"No files match {pattern}")
+        return summarize_reports([])
+
+    root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in files])
+    manifest = load_manifest(manifest_path)
+
+    reports, tasks, digests = {}, [], {}
+    for path in files:
+        output_path = os.path.join(output_dir, os.path.relpath(os.path.abspath(path), root))
+        digests[path] = file_digest(path)
+        entry = manifest.get(path)
+        if (not force and entry is not None and entry["sha256"] == digests[path]
+                and entry["report"]["output"] == output_path and os.path.exists(output_path)):
+            reports[path] = dict(entry["report"], skipped=True)
+        else:
+            tasks.append((path, output_path, chunksize))
+    print(f"{len(files)} files: {len(tasks)} to clean, {len(files) - len(tasks)} unchanged")
 
+    if tasks:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for task, report in zip(tasks, pool.map(_clean_file, tasks)):
+                path = task[0]
+                reports[path] = report
+                manifest[path] = {"sha256": digests[path], "report": report}
+        save_manifest(manifest, manifest_path)
 
-    print("Validation Results:")
-    print(f"All values are integers? {'Yes' if valid_integers.all().all() else 'No'}")
-    print(f"All values are within the valid range [0, 1, 2]? {'Yes' if valid_ranges.all().all() else 'No'}")
-    print(f" Missing values:\n{missing_values}")
+    summary = summarize_reports([reports[path] for path in files])
+    summary.to_csv(summary_path, index=False)
+    print(f"Cleaning summary saved to {summary_path}")
+    return summary
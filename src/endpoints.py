@@ -0,0 +1,263 @@
+"""
+
+This module provides multi-endpoint annotation clients:
+ Read a YAML config listing models and the endpoints (replicas) serving each,
+ with weights and per-endpoint concurrency, and send every call to the least
+ busy healthy replica. Replicas that keep failing are taken out of rotation
+ for a cooldown period and tried again afterwards.
+
+"""
+
+import os
+import re
+import threading
+import time
+
+import pandas as pd
+import requests
+import yaml
+
+from src.annotation import create_session, get_annotation
+from src.prompts import completion_max_tokens
+from src.retry import is_abort, is_throttle
+
+# Example config:
+#
+# api_key_env: LLM_API_KEY            # default key for every endpoint (or api_key: ...)
+# models:
+#   - name: llama3.1
+#     output: results/llama3.1_unbiased.csv   # optional, default: --output with {model} filled in
+#     rpm: 600                                 # optional, per-model rate limits
+#     endpoints:
+#       - url: http://gpu1:8000/v1/chat/completions
+#         weight: 2
+#         concurrency: 16
+#         health_url: http://gpu1:8000/health  # optional, probed before the run
+#       - url: http://gpu2:8000/v1/chat/completions
+#         concurrency: 8
+
+
+def resolve_api_key(entry, default=None):
+    """api_key, or the environment variable named by api_key_env, of a config entry."""
+    if entry.get("api_key") is not None:
+        return entry["api_key"]
+    if entry.get("api_key_env"):
+        return os.environ.get(entry["api_key_env"], default)
+    return default
+
+
+def load_endpoint_config(path, api_key=None):
+    """
+    Parse the endpoint config into a list of model entries, each with its name,
+    endpoints (url, api_key, weight, concurrency, health_url) and optional
+    output, rpm and tpm. `api_key` is the fallback for entries without a key.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    default_key = resolve_api_key(config, api_key)
+    models = []
+    for model in config.get("models", []):
+        if not model.get("name") or not model.get("endpoints"):
+            raise ValueError(f"{path}: every model needs a name and at least one endpoint")
+        model_key = resolve_api_key(model, default_key)
+        endpoints = []
+        for endpoint in model["endpoints"]:
+            if isinstance(endpoint, str):
+                endpoint = {"url": endpoint}
+            endpoints.append({
+                "url": endpoint["url"],
+                "api_key": resolve_api_key(endpoint, model_key),
+                "weight": float(endpoint.get("weight", 1.0)),
+                "concurrency": int(endpoint.get("concurrency", 1)),
+                "health_url": endpoint.get("health_url"),
+            })
+        if any(e["weight"] <= 0 or e["concurrency"] < 1 for e in endpoints):
+            raise ValueError(f"{path}: endpoint weights must be positive and concurrency at least 1")
+        models.append({
+            "name": model["name"],
+            "endpoints": endpoints,
+            "output": model.get("output"),
+            "rpm": model.get("rpm"),
+            "tpm": model.get("tpm"),
+        })
+    if not models:
+        raise ValueError(f"{path}: no models configured")
+    names = [model["name"] for model in models]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{path}: duplicate model names")
+    return models
+
+
+def model_output_path(output, model, n_models=1):
+    """Output file of `model`: `output` with {model} replaced by a file-name-safe model name."""
+    if "{model}" in output:
+        return output.replace("{model}", re.sub(r"[^A-Za-z0-9._-]+", "-", model))
+    if n_models > 1:
+        raise ValueError("--output must contain {model} when several models have no output of their own")
+    return output
+
+
+class Endpoint:
+    """One replica: its connection pool, in-flight count and health state."""
+
+    def __init__(self, url, api_key=None, weight=1.0, concurrency=1, health_url=None):
+        self.url = url
+        self.api_key = api_key
+        self.weight = weight
+        self.concurrency = concurrency
+        self.health_url = health_url
+        self.session = create_session(concurrency)
+        self.in_flight = 0
+        self.failures = 0
+        self.unhealthy_until = 0.0
+        # Last answer was 401/403/404: this replica refuses the key, model or URL
+        self.aborted = False
+        self.requests = 0
+        self.errors = 0
+
+    def healthy(self, now):
+        return now >= self.unhealthy_until
+
+    def load(self):
+        return self.in_flight / self.weight
+
+
+class EndpointPool:
+    """
+    Annotation client for one model served by several endpoints; a drop-in
+    replacement for Annotator (see AnnotationEngine).
+
+    Each call goes to the healthy endpoint with the lowest in-flight / weight
+    ratio that has a free slot, waiting if every slot is taken. After
+    `max_failures` consecutive connection errors, timeouts, 429s or 5xx answers
+    an endpoint is skipped for `cooldown` seconds; if every endpoint is in
+    cooldown the calls go to any endpoint rather than stall. A 401/403/404 puts
+    its endpoint in cooldown at once and the call is sent to another endpoint;
+    it is raised (aborting the run) only once every endpoint has answered so.
+
+    Parameters:
+        endpoints (list): Dicts with url, api_key, weight, concurrency and health_url.
+        cache (ResponseCache): Optional response cache consulted before every call.
+        response_format (str): "text" (default) or "json" for structured output.
+        max_tokens (int): Completion limit (default: completion_max_tokens(response_format)).
+    """
+
+    def __init__(self, model, endpoints, temperature, cache=None, response_format="text", max_tokens=None,
+                 max_failures=3, cooldown=30.0):
+        self.model = model
+        self.temperature = temperature
+        self.cache = cache
+        self.response_format = response_format
+        self.max_tokens = max_tokens if max_tokens is not None else completion_max_tokens(response_format)
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.endpoints = [Endpoint(**endpoint) for endpoint in endpoints]
+        self.concurrency = sum(endpoint.concurrency for endpoint in self.endpoints)
+        self.condition = threading.Condition()
+
+    def check_health(self, timeout=5.0):
+        """Probe every endpoint with a health_url; failing ones start in cooldown. Returns the healthy count."""
+        for endpoint in self.endpoints:
+            if not endpoint.health_url:
+                continue
+            try:
+                ok = endpoint.session.get(endpoint.health_url, timeout=timeout).status_code < 400
+            except requests.RequestException:
+                ok = False
+            if not ok:
+                print(f"{self.model}: endpoint {endpoint.url} failed its health check")
+                endpoint.failures = self.max_failures
+                endpoint.unhealthy_until = time.monotonic() + self.cooldown
+        now = time.monotonic()
+        return sum(endpoint.healthy(now) for endpoint in self.endpoints)
+
+    def _choose(self, exclude=()):
+        now = time.monotonic()
+        candidates = [endpoint for endpoint in self.endpoints if endpoint not in exclude]
+        free = [endpoint for endpoint in candidates if endpoint.in_flight < endpoint.concurrency]
+        if not free:
+            return None
+        healthy = [endpoint for endpoint in free if endpoint.healthy(now)]
+        if not healthy and not any(endpoint.healthy(now) for endpoint in candidates):
+            # Everything is in cooldown: keep going on the endpoint that recovers first
+            healthy = [min(free, key=lambda endpoint: endpoint.unhealthy_until)]
+        if not healthy:
+            return None
+        return min(healthy, key=lambda endpoint: (endpoint.load(), -endpoint.weight))
+
+    def acquire(self, exclude=()):
+        with self.condition:
+            while True:
+                endpoint = self._choose(exclude)
+                if endpoint is not None:
+                    endpoint.in_flight += 1
+                    endpoint.requests += 1
+                    return endpoint
+                # Also wakes up when a cooldown ends without any call finishing
+                self.condition.wait(timeout=0.5)
+
+    def release(self, endpoint, error=None):
+        with self.condition:
+            endpoint.in_flight -= 1
+            if error is None:
+                endpoint.failures = 0
+                endpoint.aborted = False
+            elif is_abort(error):
+                endpoint.errors += 1
+                endpoint.failures = self.max_failures
+                endpoint.aborted = True
+                endpoint.unhealthy_until = time.monotonic() + self.cooldown
+            elif is_throttle(error) or isinstance(error, (requests.ConnectionError, requests.Timeout)):
+                endpoint.errors += 1
+                endpoint.failures += 1
+                if endpoint.failures >= self.max_failures:
+                    endpoint.unhealthy_until = time.monotonic() + self.cooldown
+            else:
+                endpoint.errors += 1
+            self.condition.notify_all()
+
+    def annotate(self, prompt, bias_mode=False, run_index=0, trace=None, max_tokens=None, response_format=None,
+                 refresh=False):
+        tried = []
+        while True:
+            endpoint = self.acquire(exclude=tried)
+            if trace is not None:
+                trace["endpoint"] = endpoint.url
+            try:
+                content = get_annotation(
+                    prompt, self.model, endpoint.url, endpoint.api_key, self.temperature,
+                    bias_mode=bias_mode, session=endpoint.session, cache=self.cache, run_index=run_index,
+                    response_format=response_format or self.response_format,
+                    max_tokens=max_tokens if max_tokens is not None else self.max_tokens, trace=trace,
+                    refresh=refresh
+                )
+            except Exception as e:
+                self.release(endpoint, e)
+                tried.append(endpoint)
+                if (is_abort(e) and len(tried) < len(self.endpoints)
+                        and not all(other.aborted for other in self.endpoints)):
+                    # Another replica may still accept the call
+                    continue
+                raise
+            self.release(endpoint)
+            return content
+
+    def stats(self):
+        """Requests and errors per endpoint."""
+        now = time.monotonic()
+        return pd.DataFrame([
+            {"model": self.model, "endpoint": endpoint.url, "weight": endpoint.weight,
+             "concurrency": endpoint.concurrency, "requests": endpoint.requests, "errors": endpoint.errors,
+             "healthy": endpoint.healthy(now) and not endpoint.aborted}
+            for endpoint in self.endpoints
+        ])
+
+    def close(self):
+        for endpoint in self.endpoints:
+            endpoint.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,229 @@
+"""
+
+This module provides the evaluation grid:
+ Find every annotation result file, load each once, and compute accuracy,
+ Cohen's kappa against the ground truth, Fleiss' and run-pair kappa across
+ runs, and bias metrics of the biased settings against each model's unbiased
+ run, into one long results table (model, setting, metric, dimension, value).
+
+ The table is updated incrementally: a manifest keeps the content hash of every
+ result file, and only models with new or changed files are recomputed.
+
+"""
+
+import glob
+import hashlib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.accuracy import compute_accuracy
+from src.annotation import DIMENSION_COLUMNS, SCORE_DTYPE
+from src.bias_metrics import bias_report
+from src.cohinkappa import compute_run_pair_kappa
+from src.data_cleaning import file_digest, load_manifest, save_manifest
+from src.kappa import cohen_kappa_table, fleiss_kappa_table
+from src.result_io import load_results, output_format, save_results
+
+DIMENSIONS = list(DIMENSION_COLUMNS.values())
+# Per-run score lists of each aggregated column, e.g. STRONG -> Strength_runs
+RUN_COLUMNS = {column: f"{name}_runs" for name, column in DIMENSION_COLUMNS.items()}
+RESULT_COLUMNS = ["model", "setting", "metric", "dimension", "value", "source"]
+# <model>_<setting>.<ext>; the setting is the part after the last underscore
+LABEL_PATTERN = r"^(?P<model>.+)_(?P<setting>[^_]+)$"
+BASELINE_SETTING = "unbiased"
+
+
+def result_label(path, label_pattern=LABEL_PATTERN):
+    """(model, setting) of a result file from its name; unmatched names give (name, "")."""
+    stem = os.path.splitext(os.path.basename(path.rstrip("/\\")))[0]
+    match = re.match(label_pattern, stem)
+    if match is None:
+        return stem, ""
+    return match.group("model"), match.group("setting")
+
+
+def path_digest(path):
+    """Content hash of a result file, or of every part file of a Parquet directory."""
+    if os.path.isfile(path):
+        return file_digest(path)
+    digest = hashlib.sha256()
+    for name in sorted(os.listdir(path)):
+        if name.endswith(".parquet"):
+            digest.update(name.encode("utf-8"))
+            digest.update(file_digest(os.path.join(path, name)).encode("ascii"))
+    return digest.hexdigest()
+
+
+def find_result_files(pattern, exclude=()):
+    """Result files (and Parquet directories) matching the glob `pattern`."""
+    excluded = {os.path.abspath(path) for path in exclude}
+    paths = []
+    for path in sorted(glob.glob(pattern, recursive=True)):
+        if os.path.abspath(path) in excluded or os.path.basename(path).startswith("_"):
+            continue
+        try:
+            fmt = output_format(path)
+        except ValueError:
+            continue
+        if os.path.isfile(path) or (fmt == "parquet" and os.path.isdir(path)):
+            paths.append(path)
+    return paths
+
+
+def split_long_results(long_df, dimensions=DIMENSIONS):
+    """
+    One wide frame per setting from a long-format result table: the runs of each
+    argQ_id averaged and rounded into the dimension columns, plus their run lists
+    and the number of runs made (n_runs).
+    """
+    frames = {}
+    for setting, group in long_df.groupby('setting', sort=False):
+        by_id = group.sort_values('run').groupby('argQ_id', sort=False)
+        wide = by_id[dimensions].mean().round().astype(SCORE_DTYPE)
+        for dim in dimensions:
+            scores = group[['argQ_id', 'run', dim]].dropna().sort_values('run')
+            run_lists = scores[dim].astype(int).groupby(scores['argQ_id'], sort=False).agg(list)
+            wide[RUN_COLUMNS[dim]] = run_lists.reindex(wide.index).map(lambda x: x if isinstance(x, list) else [])
+        wide['n_runs'] = by_id['run'].count()
+        frames[setting] = wide.reset_index()
+    return frames
+
+
+def load_result_frames(path, dimensions=DIMENSIONS, label_pattern=LABEL_PATTERN):
+    """{(model, setting): frame} of one result file; long-format files yield one frame per setting."""
+    df = load_results(path)
+    if {'setting', 'run'}.issubset(df.columns):
+        model = result_label(path, label_pattern)[0]
+        return {(model, setting): frame for setting, frame in split_long_results(df, dimensions).items()}
+    return {result_label(path, label_pattern): df}
+
+
+def metric_rows(model, setting, metric, values, source):
+    return [
+        {"model": model, "setting": setting, "metric": metric, "dimension": dim, "value": value, "source": source}
+        for dim, value in values.items()
+    ]
+
+
+def run_lists_frame(df, dimensions):
+    """The run-list columns of a result frame, renamed to their dimension (plus n_runs, if recorded)."""
+    frame = df[[RUN_COLUMNS[dim] for dim in dimensions]].set_axis(dimensions, axis=1)
+    if 'n_runs' in df.columns:
+        frame['n_runs'] = df['n_runs'].to_numpy()
+    return frame
+
+
+def label_metrics(label, df, source, ground_truth, baseline, dimensions, n_boot):
+    """Accuracy, run-pair kappa and (for biased settings) bias metrics of one result frame."""
+    model, setting = label
+    rows = metric_rows(model, setting, "accuracy", compute_accuracy(ground_truth, df, dimensions), source)
+    if all(RUN_COLUMNS[dim] in df.columns for dim in dimensions):
+        pairs = compute_run_pair_kappa(run_lists_frame(df, dimensions), dimensions)
+        for name, key in (("run_kappa_mean", "Kappa"), ("run_kappa_min", "Min Kappa"), ("run_kappa_max", "Max Kappa")):
+            rows += metric_rows(model, setting, name, {dim: pairs[dim][key] for dim in dimensions}, source)
+    if baseline is not None:
+        report = bias_report(baseline, df, dimensions, n_boot=n_boot)
+        for column in report.columns:
+            if column == "n" or column.startswith("Share"):
+                continue
+            rows += metric_rows(model, setting, column, report[column].to_dict(), source)
+    return rows
+
+
+def compute_metrics(frames, sources, ground_truth, dimensions=DIMENSIONS, workers=None, n_boot=0):
+    """
+    Every metric of every (model, setting) frame against `ground_truth`, as rows of the results table.
+
+    Cohen's and Fleiss' kappa are computed for all frames in one batched call each;
+    the per-frame metrics run on a thread pool.
+    """
+    labels = list(frames)
+    rows = []
+    cohen = cohen_kappa_table(ground_truth, frames, dimensions)
+    with_runs = {
+        label: run_lists_frame(df, dimensions) for label, df in frames.items()
+        if all(RUN_COLUMNS[dim] in df.columns for dim in dimensions)
+    }
+    fleiss = fleiss_kappa_table(with_runs, dimensions) if with_runs else pd.DataFrame(columns=cohen.columns)
+    for metric, table in (("cohen_kappa", cohen), ("fleiss_kappa", fleiss)):
+        for record in table.itertuples(index=False):
+            label = (record.Model, record.Setting)
+            rows.append({"model": record.Model, "setting": record.Setting, "metric": metric,
+                         "dimension": record.Dimension, "value": record.Kappa, "source": sources[label]})
+
+    def baseline_of(label):
+        model, setting = label
+        if setting in ("", BASELINE_SETTING):
+            return None
+        return frames.get((model, BASELINE_SETTING))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for label_rows in pool.map(
+            lambda label: label_metrics(
+                label, frames[label], sources[label], ground_truth, baseline_of(label), dimensions, n_boot
+            ),
+            labels,
+        ):
+            rows += label_rows
+    return pd.DataFrame(rows, columns=RESULT_COLUMNS)
+
+
+def evaluate_results(ground_truth_path, pattern, output_path, dimensions=DIMENSIONS, manifest_path=None,
+                     workers=None, n_boot=0, label_pattern=LABEL_PATTERN, force=False):
+    """
+    Compute the evaluation grid for every result file matching `pattern` and
+    write one consolidated table to `output_path` (.csv, .jsonl or .parquet).
+
+    Parameters:
+        ground_truth_path (str): Human annotations with argQ_id and the dimension columns.
+        pattern (str): Glob of result files, named <model>_<setting> (see LABEL_PATTERN)
+                       or long-format files from run_annotation.py --settings.
+        manifest_path (str): Content hashes of the evaluated files; defaults to
+                             <output_path>.manifest.json.
+        n_boot (int): Bootstrap resamples for the bias-metric confidence intervals (0: none).
+        force (bool): Recompute everything instead of only new or changed files.
+    Returns:
+        pd.DataFrame: The consolidated results table.
+    """
+    if manifest_path is None:
+        manifest_path = output_path.rstrip("/\\") + ".manifest.json"
+    files = find_result_files(pattern, exclude=[ground_truth_path, output_path])
+    digests = {path: path_digest(path) for path in files}
+    settings = {"dimensions": list(dimensions), "n_boot": n_boot, "ground_truth": path_digest(ground_truth_path)}
+
+    manifest = load_manifest(manifest_path)
+    previous = pd.DataFrame(columns=RESULT_COLUMNS)
+    known = {}
+    if not force and manifest.get("settings") == settings and os.path.exists(output_path):
+        previous = load_results(output_path)
+        known = manifest.get("files", {})
+
+    # A model is recomputed as a whole when any of its files is new or changed (bias rows need its baseline)
+    labels = {path: result_label(path, label_pattern) for path in files}
+    changed_models = {labels[path][0] for path in files if known.get(path) != digests[path]}
+    pending = [path for path in files if labels[path][0] in changed_models]
+    kept = previous[previous['source'].isin(set(files) - set(pending))]
+    print(f"{len(files)} result files: {len(pending)} to evaluate, {len(files) - len(pending)} unchanged")
+
+    ground_truth = load_results(ground_truth_path, columns=['argQ_id'] + list(dimensions))
+    frames, sources = {}, {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for path, loaded in zip(pending, pool.map(lambda p: load_result_frames(p, dimensions, label_pattern), pending)):
+            for label, df in loaded.items():
+                frames[label] = df
+                sources[label] = path
+
+    new_rows = compute_metrics(frames, sources, ground_truth, dimensions, workers, n_boot) if frames else None
+    parts = [df for df in (kept, new_rows) if df is not None and len(df)]
+    table = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=RESULT_COLUMNS)
+    table = table.sort_values(["model", "setting", "metric", "dimension"], kind="stable").reset_index(drop=True)
+    table["value"] = table["value"].astype(np.float64)
+
+    save_results(table, output_path)
+    save_manifest({"settings": settings, "files": digests}, manifest_path)
+    print(f"Evaluation results saved to {output_path}")
+    return table
@@ -1,6 +1,8 @@
 import pandas as pd
+import numpy as np
 import ast
-from statsmodels.stats.inter_rater import fleiss_kappa
+
+from src.kappa import adaptive_runs_cap, category_counts, fleiss_kappa_from_counts, run_lists_to_codes
 
 def parse_run_list(x):
   
@@ -12,46 +14,26 @@ def parse_run_list(x):
             return []
     return x
 
-def get_score_frequencies(score_list):
-  
-    frequencies = [0, 0, 0]  
-    
-    if isinstance(score_list, list):
-        for score in score_list:
-            if score == 0:
-                frequencies[0] += 1
-            elif score == 1:
-                frequencies[1] += 1
-            elif score == 2:
-                frequencies[2] += 1
-    return frequencies
-
-def compute_fleiss_kappa(df, dimensions):
+def compute_fleiss_kappa(df, dimensions, runs=None):
  
     for dim in dimensions:
         df[dim] = df[dim].apply(parse_run_list)
 
-    df_frequencies = pd.DataFrame({
-        f"{dim}_freq": df[dim].apply(get_score_frequencies) for dim in dimensions
-    })
-
-    for dim in dimensions:
-        df_frequencies[[f"{dim}_0", f"{dim}_1", f"{dim}_2"]] = pd.DataFrame(df_frequencies[f"{dim}_freq"].tolist(), index=df_frequencies.index)
-
-  
-    df_frequencies = df_frequencies.drop(columns=[f"{dim}_freq" for dim in dimensions])
-
-
-    df_frequencies["sum_frequencies"] = df_frequencies[[f"{dim}_0", f"{dim}_1", f"{dim}_2"]].sum(axis=1)
+    # Category counts of every dimension as one (dimensions x rows x 3) array; with
+    # `runs` or an n_runs column (adaptive runs: min(n_runs)), only the first runs
+    # of each row are counted
+    runs = adaptive_runs_cap(df, runs)
+    codes = [run_lists_to_codes(df[dim], n_categories=3, runs=runs) for dim in dimensions]
+    frequencies = np.stack([category_counts(block, 3) for block in codes])
 
-    df_frequencies_cleaned = df_frequencies[df_frequencies["sum_frequencies"] == 3].drop(columns=["sum_frequencies"])
+    # Rows are kept when the last dimension holds a full set of valid scores (as the per-column
+    # version did with 3 runs), so every subject has the same number of ratings
+    complete = frequencies[-1].sum(axis=1) == codes[-1].shape[1]
 
-    print(f"Removed {len(df_frequencies) - len(df_frequencies_cleaned)} rows with inconsistent annotation counts.")
+    print(f"Removed {len(df) - complete.sum()} rows with inconsistent annotation counts.")
 
-    kappa_results = {
-        dim: fleiss_kappa(df_frequencies_cleaned[[f"{dim}_0", f"{dim}_1", f"{dim}_2"]].to_numpy(), method='fleiss')
-        for dim in dimensions
-    }
+    kappas = fleiss_kappa_from_counts(frequencies[:, complete])
+    kappa_results = {dim: kappas[d] for d, dim in enumerate(dimensions)}
 
     return kappa_results
 
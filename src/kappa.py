@@ -0,0 +1,285 @@
+"""
+
+This module provides vectorized agreement statistics:
+ Cohen's kappa (unweighted, linear or quadratic weighted) from confusion
+ matrices and Fleiss' kappa from per-subject category counts, both built with
+ np.bincount on integer-coded ratings. Every kernel takes a leading batch axis,
+ so all dimensions, models and settings of an evaluation grid are scored in one call.
+
+ Ratings are coded as 0..k-1; MISSING (-1) marks an absent or out-of-range rating.
+
+"""
+
+import ast
+
+import numpy as np
+import pandas as pd
+
+MISSING = -1
+KAPPA_WEIGHTS = (None, "linear", "quadratic")
+
+
+def encode_ratings(values, n_categories=None):
+    """
+    Integer codes of `values` (array-like, NaN/<NA> allowed).
+
+    Non-integer, negative, missing and (with `n_categories`) too large values become MISSING.
+    """
+    if isinstance(values, (pd.Series, pd.DataFrame)):
+        values = values.to_numpy(dtype=np.float64, na_value=np.nan)
+    values = np.asarray(values, dtype=np.float64)
+    valid = (values >= 0) & (values == np.floor(values))
+    if n_categories is not None:
+        valid &= values < n_categories
+    codes = np.full(values.shape, MISSING, dtype=np.int64)
+    codes[valid] = values[valid]
+    return codes
+
+
+def factorize_ratings(*columns):
+    """
+    Shared integer codes of label columns of any type (strings, categories, ...).
+
+    Labels are numbered over the union of all columns, so a label gets the same
+    code in each; missing values become MISSING.
+    """
+    arrays = [np.asarray(column, dtype=object) for column in columns]
+    codes, _ = pd.factorize(np.concatenate(arrays))
+    return np.split(codes.astype(np.int64), np.cumsum([len(array) for array in arrays])[:-1])
+
+
+def run_lists_to_codes(run_lists, n_categories=None, runs=None):
+    """
+    Pack a column of run lists (lists or their string form) into an (n, runs)
+    code array, padded with MISSING; `runs` defaults to the longest list.
+    """
+    lists = []
+    for x in run_lists:
+        if isinstance(x, str):
+            try:
+                x = ast.literal_eval(x.strip())
+            except (ValueError, SyntaxError):
+                x = []
+        lists.append(x if isinstance(x, (list, tuple, np.ndarray)) else [])
+    lengths = np.fromiter((len(x) for x in lists), dtype=np.int64, count=len(lists))
+    flat = encode_ratings([score for x in lists for score in x], n_categories)
+    return pack_runs(flat, lengths, runs)
+
+
+def adaptive_runs_cap(frame, runs=None):
+    """
+    Runs to score in a result frame: with an n_runs column (adaptive runs), only
+    the first min(n_runs) runs of every row were made regardless of agreement,
+    and the extra runs of disagreeing rows would bias agreement, so `runs` is
+    capped at that count. Without n_runs, `runs` is returned unchanged.
+    """
+    if 'n_runs' not in frame.columns or not len(frame):
+        return runs
+    cap = int(frame['n_runs'].min())
+    return cap if runs is None else min(runs, cap)
+
+
+def pack_runs(flat_codes, lengths, runs=None):
+    """
+    Scatter concatenated run codes into an (n, runs) array, padded with MISSING;
+    `lengths` holds the number of runs of each row and `runs` defaults to the longest.
+    """
+    flat_codes = np.asarray(flat_codes)
+    lengths = np.asarray(lengths, dtype=np.int64)
+    if runs is None:
+        runs = int(lengths.max()) if len(lengths) else 0
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    positions = np.arange(len(flat_codes)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    keep = positions < runs
+    codes = np.full((len(lengths), runs), MISSING, dtype=np.int64)
+    codes[rows[keep], positions[keep]] = flat_codes[keep]
+    return codes
+
+
+def n_categories_of(*code_arrays):
+    """Smallest k that holds every code in the arrays (at least 1)."""
+    return max([1] + [int(codes.max()) + 1 for codes in code_arrays if codes.size])
+
+
+def confusion_matrices(rater_a, rater_b, n_categories):
+    """
+    Confusion matrices of two coded raters of shape (..., n).
+
+    Pairs with a MISSING rating on either side are skipped. Returns counts of
+    shape (..., k, k) with rater_a on the rows.
+    """
+    rater_a = np.asarray(rater_a)
+    rater_b = np.asarray(rater_b)
+    k = n_categories
+    batch_shape = rater_a.shape[:-1]
+    a = rater_a.reshape(-1, rater_a.shape[-1])
+    b = rater_b.reshape(-1, rater_b.shape[-1])
+    batches = len(a)
+    valid = (a >= 0) & (b >= 0)
+    cells = a * k + b + (np.arange(batches) * k * k)[:, None]
+    counts = np.bincount(cells[valid], minlength=batches * k * k)
+    return counts.reshape(*batch_shape, k, k)
+
+
+def kappa_weights(n_categories, weights=None):
+    """Disagreement weights: 1 off the diagonal, or |i - j| (linear), or (i - j)**2 (quadratic)."""
+    if weights not in KAPPA_WEIGHTS:
+        raise ValueError(f"Unknown kappa weights {weights!r}: use one of {KAPPA_WEIGHTS}")
+    positions = np.arange(n_categories)
+    distance = np.abs(positions[:, None] - positions[None, :]).astype(np.float64)
+    if weights is None:
+        return (distance > 0).astype(np.float64)
+    if weights == "linear":
+        return distance
+    return distance ** 2
+
+
+def cohen_kappa_from_confusion(confusion, weights=None):
+    """Cohen's kappa of confusion matrices of shape (..., k, k), computed as in sklearn."""
+    confusion = np.asarray(confusion, dtype=np.float64)
+    w = kappa_weights(confusion.shape[-1], weights)
+    sum0 = confusion.sum(axis=-2)
+    sum1 = confusion.sum(axis=-1)
+    expected = sum0[..., :, None] * sum1[..., None, :] / sum0.sum(axis=-1)[..., None, None]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return 1 - (w * confusion).sum(axis=(-2, -1)) / (w * expected).sum(axis=(-2, -1))
+
+
+def cohen_kappa(rater_a, rater_b, weights=None, n_categories=None):
+    """
+    Cohen's kappa between two raters of shape (..., n), batched over the leading axes.
+
+    Weighted kappa uses the positions 0..k-1 of the rating scale. sklearn instead
+    uses positions among the labels that occur, so the two agree whenever the
+    observed labels are 0..k-1 without gaps (unweighted kappa always agrees).
+    """
+    a = encode_ratings(rater_a, n_categories)
+    b = encode_ratings(rater_b, n_categories)
+    if n_categories is None:
+        n_categories = n_categories_of(a, b)
+    return cohen_kappa_from_confusion(confusion_matrices(a, b, n_categories), weights)
+
+
+def category_counts(codes, n_categories):
+    """Per-subject category counts of coded ratings of shape (..., n, raters) -> (..., n, k)."""
+    codes = np.asarray(codes)
+    k = n_categories
+    subjects = codes.reshape(-1, codes.shape[-1])
+    valid = subjects >= 0
+    cells = subjects + (np.arange(len(subjects)) * k)[:, None]
+    counts = np.bincount(cells[valid], minlength=len(subjects) * k)
+    return counts.reshape(*codes.shape[:-1], k)
+
+
+def fleiss_kappa_from_counts(counts, mask=None):
+    """
+    Fleiss' kappa of category-count tables of shape (..., n, k), computed as in
+    statsmodels.stats.inter_rater.fleiss_kappa(method='fleiss').
+
+    `mask` (..., n) selects the subjects of each table; a table without
+    subjects gives NaN.
+    """
+    table = np.asarray(counts, dtype=np.float64)
+    if mask is None:
+        mask = np.ones(table.shape[:-1], dtype=bool)
+    table = table * mask[..., None]
+    subjects = mask.sum(axis=-1)
+    n_total = table.sum(axis=(-2, -1))
+    n_rat = np.where(mask, table.sum(axis=-1), 0).max(axis=-1, initial=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p_cat = table.sum(axis=-2) / n_total[..., None]
+        p_rat = ((table * table).sum(axis=-1) - n_rat[..., None]) / (n_rat * (n_rat - 1.0))[..., None]
+        p_mean = np.where(mask, p_rat, 0).sum(axis=-1) / subjects
+        p_mean_exp = (p_cat * p_cat).sum(axis=-1)
+        return (p_mean - p_mean_exp) / (1 - p_mean_exp)
+
+
+def fleiss_kappa(ratings, n_categories=None):
+    """
+    Fleiss' kappa of ratings of shape (..., n, raters), batched over the leading axes.
+
+    Only subjects rated by every rater are used, as statsmodels expects a
+    constant number of ratings per subject.
+    """
+    codes = encode_ratings(ratings, n_categories)
+    if n_categories is None:
+        n_categories = n_categories_of(codes)
+    counts = category_counts(codes, n_categories)
+    return fleiss_kappa_from_counts(counts, mask=counts.sum(axis=-1) == codes.shape[-1])
+
+
+def _align_codes(reference, df, dim, key, n_categories):
+    codes = encode_ratings(df[dim], n_categories)
+    if key is None:
+        if len(df) != len(reference):
+            raise ValueError("Frames of different length need a key column to be aligned")
+        return codes
+    first = ~df[key].duplicated().to_numpy()
+    positions = pd.Index(df[key][first]).get_indexer(reference[key])
+    return np.where(positions >= 0, codes[first][positions], MISSING)
+
+
+def cohen_kappa_table(ground_truth_df, results, dimensions, weights=None, n_categories=3, key='argQ_id'):
+    """
+    Cohen's kappa of every (model, setting) result frame against the ground truth,
+    for every dimension, in one batched call.
+
+    Parameters:
+        results (dict): {(model_name, setting): results DataFrame}.
+        key (str): Column used to align rows when both frames have it; otherwise
+                   rows are paired by position, like cohen_kappa_score.
+    Returns:
+        pd.DataFrame with columns Model, Setting, Dimension, Kappa.
+    """
+    labels = list(results)
+    rater_a, rater_b = [], []
+    for model_setting in labels:
+        df = results[model_setting]
+        frame_key = key if key in df.columns and key in ground_truth_df.columns else None
+        for dim in dimensions:
+            rater_a.append(_align_codes(ground_truth_df, df, dim, frame_key, n_categories))
+            rater_b.append(encode_ratings(ground_truth_df[dim], n_categories))
+    shape = (len(labels) * len(dimensions), len(ground_truth_df))
+    kappas = cohen_kappa_from_confusion(
+        confusion_matrices(
+            np.reshape(rater_a, shape).astype(np.int64), np.reshape(rater_b, shape).astype(np.int64), n_categories
+        ),
+        weights,
+    )
+    rows = [(model, setting, dim) for model, setting in labels for dim in dimensions]
+    table = pd.DataFrame(rows, columns=["Model", "Setting", "Dimension"])
+    table["Kappa"] = kappas
+    return table
+
+
+def fleiss_kappa_table(results, dimensions, n_categories=3):
+    """
+    Fleiss' kappa across runs for every (model, setting) result frame and
+    dimension, in one batched call.
+
+    Parameters:
+        results (dict): {(model_name, setting): DataFrame whose `dimensions` columns hold run lists}.
+                        A frame with an n_runs column is scored on its first min(n_runs) runs.
+    Returns:
+        pd.DataFrame with columns Model, Setting, Dimension, Kappa and Subjects
+        (the number of rows with a complete set of runs).
+    """
+    labels = list(results)
+    blocks = [
+        run_lists_to_codes(results[label][dim], n_categories, runs=adaptive_runs_cap(results[label]))
+        for label in labels for dim in dimensions
+    ]
+    n = max([0] + [len(block) for block in blocks])
+    runs = max([0] + [block.shape[1] for block in blocks])
+    codes = np.full((len(blocks), n, runs), MISSING, dtype=np.int64)
+    mask = np.zeros((len(blocks), n), dtype=bool)
+    for b, block in enumerate(blocks):
+        codes[b, :len(block), :block.shape[1]] = block
+        if block.shape[1]:
+            mask[b, :len(block)] = (block >= 0).sum(axis=1) == block.shape[1]
+    counts = category_counts(codes, n_categories)
+    rows = [(model, setting, dim) for model, setting in labels for dim in dimensions]
+    table = pd.DataFrame(rows, columns=["Model", "Setting", "Dimension"])
+    table["Kappa"] = fleiss_kappa_from_counts(counts, mask)
+    table["Subjects"] = mask.sum(axis=1)
+    return table
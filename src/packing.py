@@ -0,0 +1,89 @@
+"""
+
+This module provides the agreement check for packed prompting:
+ Annotate the same rows one argument per request and K arguments per request,
+ and report for every K the agreement with the single-argument scores
+ (accuracy.compute_accuracy), the requests and tokens spent per argument, the
+ share of arguments that fell back to single requests and the throughput.
+
+"""
+
+import asyncio
+import time
+
+import pandas as pd
+
+from src.accuracy import compute_accuracy
+from src.annotation import DIMENSION_COLUMNS, Annotator
+from src.async_annotation import AnnotationEngine
+from src.prompts import TokenBudget
+from src.telemetry import Telemetry
+
+DIMENSIONS = list(DIMENSION_COLUMNS.values())
+
+
+async def annotate_with_pack_size(df, annotator, pack_size, runs=1, prompt_type="unbiased", bias_type="female",
+                                  concurrency=8, retry_policy=None):
+    """Annotate `df` with `pack_size` arguments per request; returns (results, stats dict)."""
+    budget = TokenBudget()
+    telemetry = Telemetry(total=len(df), progress=False)
+    engine = AnnotationEngine(
+        annotator, runs=runs, prompt_type=prompt_type, bias_type=bias_type, concurrency=concurrency,
+        retry_policy=retry_policy, budget=budget, telemetry=telemetry, pack_size=pack_size
+    )
+    start = time.perf_counter()
+    try:
+        results = await engine.annotate_frame(df)
+    finally:
+        engine.close()
+    seconds = time.perf_counter() - start
+    usage = telemetry.summary()
+    prompt_tokens = int(usage["prompt_tokens"].sum()) if len(usage) else 0
+    completion_tokens = int(usage["completion_tokens"].sum()) if len(usage) else 0
+    if not prompt_tokens:
+        # Provider did not report usage: fall back to the offline estimates
+        prompt_tokens, completion_tokens = budget.prompt_tokens, budget.completion_tokens
+    arguments = len(df) * runs
+    stats = {
+        "pack_size": pack_size,
+        "requests": telemetry.requests,
+        "fallback_share": engine.fallbacks / arguments if arguments else float("nan"),
+        "prompt_tokens_per_argument": prompt_tokens / arguments if arguments else float("nan"),
+        "completion_tokens_per_argument": completion_tokens / arguments if arguments else float("nan"),
+        "arguments_per_s": arguments / seconds if seconds else float("nan"),
+        "seconds": seconds,
+    }
+    return results, stats
+
+
+async def compare_pack_sizes_async(df, model, api_endpoint, api_key, temperature, pack_sizes=(2, 4, 8), runs=1,
+                                   prompt_type="unbiased", bias_type="female", concurrency=8, cache=None,
+                                   retry_policy=None, dimensions=DIMENSIONS):
+    """
+    Annotate `df` once per pack size (1 first, as the reference) and return one
+    row per pack size with the cost and throughput stats and the agreement of
+    every dimension with the single-argument results.
+
+    Use temperature 0 (and runs=1) so that disagreement measures the packing, not sampling noise.
+    """
+    rows = []
+    with Annotator(model, api_endpoint, api_key, temperature, pool_size=concurrency, cache=cache) as annotator:
+        reference = None
+        for pack_size in [1] + [k for k in pack_sizes if k != 1]:
+            results, stats = await annotate_with_pack_size(
+                df, annotator, pack_size, runs, prompt_type, bias_type, concurrency, retry_policy
+            )
+            if reference is None:
+                reference = results
+            agreement = compute_accuracy(reference, results, dimensions)
+            stats.update({f"agreement_{dim}": value for dim, value in agreement.items()})
+            rows.append(stats)
+            print(f"pack_size {pack_size}: {stats['requests']} requests, "
+                  f"{stats['prompt_tokens_per_argument']:.0f} prompt tokens per argument, "
+                  f"agreement {agreement['Overall_Accuracy']:.3f}")
+    return pd.DataFrame(rows)
+
+
+def compare_pack_sizes(*args, **kwargs):
+    """Blocking wrapper around compare_pack_sizes_async."""
+    return asyncio.run(compare_pack_sizes_async(*args, **kwargs))
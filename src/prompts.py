@@ -0,0 +1,138 @@
+"""
+
+This module provides prompt templates and offline token accounting:
+ A PromptTemplate keeps the static rubric of a setting as one precompiled,
+ byte-identical prefix (so provider prefix caching applies) and only splices
+ the claim and premises in per request. Token counts are estimated offline
+ and can be charged against a per-run TokenBudget.
+
+"""
+
+import math
+
+# ~4 characters per token is the usual rule of thumb for English BPE vocabularies
+CHARS_PER_TOKEN = 4
+# Chat formatting overhead per message (role markers, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# What a complete answer looks like in each response format
+EXPECTED_OUTPUTS = {
+    "text": "Strength: 2\nSpecificity: 2\nPersuasiveness: 2\nObjectivity: 1",
+    "json": '{"Strength": 2, "Specificity": 2, "Persuasiveness": 2, "Objectivity": 1}',
+}
+
+
+class BudgetExceededError(RuntimeError):
+    """Raised when a request would take a run past its token or cost budget."""
+
+
+class PromptTemplate:
+    """
+    Prompt of one setting, split into static parts around the two fields:
+
+        rubric + claim_label + claim + middle + premises + suffix
+
+    `prefix` (rubric + claim_label) is built once and shared by every request;
+    `rubric` (bias statement and scoring rules) alone is reused by packed prompts.
+    """
+
+    def __init__(self, rubric, claim_label, middle, suffix):
+        self.rubric = rubric
+        self.claim_label = claim_label
+        self.prefix = rubric + claim_label
+        self.middle = middle
+        self.suffix = suffix
+        self.static_tokens = estimate_tokens(self.prefix + middle + suffix)
+        self.prefix_tokens = estimate_tokens(self.prefix)
+
+    def with_preamble(self, preamble):
+        return PromptTemplate(preamble + self.rubric, self.claim_label, self.middle, self.suffix)
+
+    def render(self, claim, premises):
+        # format() matches what an f-string does with the same values
+        return "".join((self.prefix, format(claim), self.middle, format(premises), self.suffix))
+
+    def estimate_prompt_tokens(self, claim, premises):
+        return self.static_tokens + estimate_tokens(format(claim)) + estimate_tokens(format(premises))
+
+
+def estimate_tokens(text):
+    """Offline token estimate of `text` (no tokenizer needed)."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_payload_tokens(payload):
+    """Estimated prompt tokens of a chat-completion payload, system message included."""
+    return sum(estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in payload["messages"])
+
+
+def completion_max_tokens(response_format="text", headroom=4.0, minimum=32):
+    """
+    max_tokens for one annotation: the expected answer's size times `headroom`,
+    leaving room for a short preamble but not for an essay.
+    """
+    return max(minimum, math.ceil(estimate_tokens(EXPECTED_OUTPUTS[response_format]) * headroom))
+
+
+def expected_completion_tokens(response_format="text"):
+    return estimate_tokens(EXPECTED_OUTPUTS[response_format])
+
+
+class TokenBudget:
+    """
+    Token and cost ceiling for one run. Each request is check()ed against what
+    has been spent before it is sent and charge()d with its offline estimate once
+    the API answered it (cache hits and errors cost nothing), so requests already
+    in flight when the budget runs out may overshoot it.
+
+    Parameters:
+        max_tokens (int): Total prompt + completion tokens allowed (None: unlimited).
+        max_cost (float): Total cost allowed (None: unlimited).
+        prompt_price (float): Price per 1,000 prompt tokens.
+        completion_price (float): Price per 1,000 completion tokens.
+    """
+
+    def __init__(self, max_tokens=None, max_cost=None, prompt_price=0.0, completion_price=0.0):
+        self.max_tokens = max_tokens
+        self.max_cost = max_cost
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.requests = 0
+
+    def cost(self, prompt_tokens, completion_tokens):
+        return (prompt_tokens * self.prompt_price + completion_tokens * self.completion_price) / 1000
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def total_cost(self):
+        return self.cost(self.prompt_tokens, self.completion_tokens)
+
+    def check(self, prompt_tokens, completion_tokens):
+        """Raise BudgetExceededError if one more such request does not fit in what is left."""
+        if self.max_tokens is not None and self.total_tokens + prompt_tokens + completion_tokens > self.max_tokens:
+            raise BudgetExceededError(
+                f"Token budget of {self.max_tokens} reached after {self.requests} requests"
+            )
+        if self.max_cost is not None and self.total_cost + self.cost(prompt_tokens, completion_tokens) > self.max_cost:
+            raise BudgetExceededError(
+                f"Cost budget of {self.max_cost} reached after {self.requests} requests"
+            )
+
+    def charge(self, prompt_tokens, completion_tokens):
+        """Account for one answered request."""
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.requests += 1
+
+    def summary(self):
+        return {
+            "requests": self.requests,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cost": self.total_cost,
+        }
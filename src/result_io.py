@@ -0,0 +1,127 @@
+"""
+
+This module provides reading and writing of annotation results:
+ CSV, JSONL and Parquet. In Parquet the per-run score lists ({dimension}_runs)
+ are stored as native list<int8> columns and the aggregated scores as nullable
+ int8, so a saved frame reloads with the same types and no string parsing.
+
+ A Parquet result may be a single file or a directory of part files (as
+ written batch by batch by checkpoint.ResultWriter); both load as one table.
+
+"""
+
+import ast
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from src.kappa import encode_ratings, pack_runs, run_lists_to_codes
+
+RUN_LIST_TYPE = pa.list_(pa.int8())
+
+
+def output_format(path):
+    extension = os.path.splitext(path.rstrip("/\\"))[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+    if extension in (".parquet", ".pq"):
+        return "parquet"
+    raise ValueError(f"Unsupported output format for {path}: use .csv, .jsonl or .parquet")
+
+
+def is_run_column(column):
+    return str(column).endswith("_runs")
+
+
+def parse_run_lists(column):
+    """Turn a column of stringified run lists ("[1, 2, 1]") back into lists."""
+    def parse(x):
+        if isinstance(x, str):
+            try:
+                return ast.literal_eval(x.strip())
+            except (ValueError, SyntaxError):
+                return []
+        return x
+    return column.map(parse)
+
+
+def results_to_table(results_df, schema=None):
+    """Arrow table of a result frame with list<int8> run columns (cast to `schema` if given)."""
+    table = pa.Table.from_pandas(results_df, preserve_index=False)
+    if schema is not None:
+        return table.cast(schema)
+    fields = [
+        pa.field(field.name, RUN_LIST_TYPE) if is_run_column(field.name) else field
+        for field in table.schema
+    ]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def table_to_results(table):
+    """Pandas frame of an Arrow result table; run columns become lists of ints."""
+    df = table.to_pandas()
+    for name in table.column_names:
+        if is_run_column(name):
+            run_lists = np.empty(len(df), dtype=object)
+            run_lists[:] = table.column(name).to_pylist()
+            df[name] = run_lists
+    return df
+
+
+def save_results(results_df, filepath):
+    """Write a result frame in the format given by the extension of `filepath`."""
+    fmt = output_format(filepath)
+    directory = os.path.dirname(filepath)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if fmt == "csv":
+        results_df.to_csv(filepath, index=False)
+    elif fmt == "jsonl":
+        results_df.to_json(filepath, orient="records", lines=True, force_ascii=False)
+    else:
+        pq.write_table(results_to_table(results_df), filepath)
+
+
+def load_results(filepath, columns=None):
+    """
+    Read a result file written by save_results or run_annotation.py.
+
+    Run-list columns come back as lists whatever the format; only CSV needs
+    them parsed from their string form.
+    """
+    fmt = output_format(filepath)
+    if fmt == "parquet":
+        return table_to_results(pq.read_table(filepath, columns=columns))
+    if fmt == "csv":
+        df = pd.read_csv(filepath, usecols=columns)
+    else:
+        df = pd.read_json(filepath, lines=True)
+        if columns is not None:
+            df = df[columns]
+    for column in df.columns:
+        if is_run_column(column):
+            df[column] = parse_run_lists(df[column])
+    return df
+
+
+def runs_matrix(results, column, runs=None):
+    """
+    (n, runs) int8 matrix of a run-list column, with MISSING (-1) for absent runs.
+
+    `results` is a result frame or a result file path; from Parquet the matrix
+    is built straight from the Arrow list offsets without creating Python lists.
+    """
+    if isinstance(results, str) and output_format(results) == "parquet":
+        values = pq.read_table(results, columns=[column]).column(column).combine_chunks()
+        lengths = pc.fill_null(pc.list_value_length(values), 0).to_numpy()
+        flat = encode_ratings(pc.list_flatten(values).to_numpy(zero_copy_only=False))
+        return pack_runs(flat, lengths, runs).astype(np.int8)
+    if isinstance(results, str):
+        results = load_results(results, columns=[column])
+    return run_lists_to_codes(results[column], runs=runs).astype(np.int8)
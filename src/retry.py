@@ -0,0 +1,181 @@
+"""
+
+This module provides failure handling for annotation calls:
+ Classify API errors as retryable, per-run fatal or run-aborting, back off with
+ jittered exponential delays that honour Retry-After, shrink concurrency under
+ 429/5xx pressure, and keep a ledger of the runs that were finally lost.
+
+"""
+
+import asyncio
+import email.utils
+import random
+import time
+
+import pandas as pd
+import requests
+
+# Worth retrying: throttling, timeouts and transient server errors
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+# Every further call would fail the same way (bad key, no access, wrong URL/model)
+ABORT_STATUS_CODES = {401, 403, 404}
+
+
+class AnnotationAPIError(Exception):
+    """Non-200 answer from the chat-completions endpoint."""
+
+    def __init__(self, status_code, message, retry_after=None):
+        super().__init__(f"Error {status_code}: {message}")
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class UnparseableAnswerError(ValueError):
+    """200 answer that does not hold every score; retried like a transient error."""
+
+    def __init__(self, annotation, excerpt_length=80):
+        excerpt = " ".join(str(annotation).split())
+        if len(excerpt) > excerpt_length:
+            excerpt = excerpt[:excerpt_length] + "..."
+        super().__init__(f"unparseable answer: {excerpt}")
+        self.annotation = annotation
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP-date), or None."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+def is_throttle(error):
+    """True for rate-limit or server-overload answers that should slow the whole run down."""
+    return isinstance(error, AnnotationAPIError) and (error.status_code == 429 or error.status_code >= 500)
+
+
+def is_abort(error):
+    return isinstance(error, AnnotationAPIError) and error.status_code in ABORT_STATUS_CODES
+
+
+class RetryPolicy:
+    """
+    Jittered exponential backoff.
+
+    Parameters:
+        max_retries (int): Retries after the first attempt.
+        base_delay (float): Delay scale in seconds; attempt k waits up to base_delay * 2**k.
+        max_delay (float): Upper bound of any single delay, including Retry-After.
+    """
+
+    def __init__(self, max_retries=5, base_delay=1.0, max_delay=60.0):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def is_retryable(self, error):
+        if isinstance(error, UnparseableAnswerError):
+            return True
+        if isinstance(error, AnnotationAPIError):
+            return error.status_code in RETRYABLE_STATUS_CODES
+        return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+    def delay(self, attempt, error=None):
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            return min(self.max_delay, retry_after)
+        # "Full jitter": spread retries of simultaneously throttled calls over the whole window.
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, fn, *args, **kwargs):
+        """Call `fn` synchronously, sleeping between retryable failures."""
+        attempt = 0
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+                time.sleep(self.delay(attempt, e))
+                attempt += 1
+
+
+class AdaptiveConcurrency:
+    """
+    Concurrency limit that adapts to provider pressure (additive increase,
+    multiplicative decrease), used in place of a fixed asyncio.Semaphore.
+
+    The limit starts at `maximum`, is multiplied by `decrease_factor` on a
+    throttled call (at most once per `cooldown` seconds, so one burst of 429s
+    counts once) and grows by one after `limit` consecutive successes.
+    """
+
+    def __init__(self, maximum, minimum=1, decrease_factor=0.5, cooldown=1.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.limit = maximum
+        self.in_flight = 0
+        self.successes = 0
+        self.last_decrease = float("-inf")
+        self.condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def record_success(self):
+        self.successes += 1
+        if self.successes >= self.limit and self.limit < self.maximum:
+            self.limit += 1
+            self.successes = 0
+
+    def record_throttle(self):
+        now = time.monotonic()
+        if now - self.last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, int(self.limit * self.decrease_factor))
+            self.successes = 0
+            self.last_decrease = now
+
+
+class FailureLedger:
+    """Record of every run that was given up on, one entry per (argQ_id, setting, run)."""
+
+    COLUMNS = ["argQ_id", "setting", "run", "attempts", "status_code", "error"]
+
+    def __init__(self):
+        self.entries = []
+
+    def record(self, argQ_id, setting, run_index, attempts, error):
+        self.entries.append({
+            "argQ_id": argQ_id,
+            "setting": setting,
+            "run": run_index,
+            "attempts": attempts,
+            "status_code": getattr(error, "status_code", None),
+            "error": str(error),
+        })
+
+    def __len__(self):
+        return len(self.entries)
+
+    def to_frame(self):
+        return pd.DataFrame(self.entries, columns=self.COLUMNS)
+
+    def save(self, filepath):
+        self.to_frame().to_csv(filepath, index=False)
+        print(f"Failure ledger saved to {filepath}")
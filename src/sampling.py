@@ -0,0 +1,88 @@
+"""
+
+This module provides stratified sampling of arguments:
+ Draw a per-company (or any other stratum) sample in one pass over the data,
+ with equal or proportional allocation, capped at the rows each stratum has,
+ and return the sampling plan that was followed.
+
+ Randomness comes from a NumPy Generator seeded with `random_state`, so the
+ sample does not depend on the pandas version.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+ALLOCATIONS = ("equal", "proportional")
+
+
+def allocate(sizes, total, allocation="equal"):
+    """
+    Quota per stratum for a sample of `total` rows, before capping at the stratum sizes.
+
+    "equal" gives every stratum int(total / strata) rows; "proportional" splits
+    `total` by stratum size with largest-remainder rounding.
+    """
+    sizes = np.asarray(sizes, dtype=np.int64)
+    if allocation not in ALLOCATIONS:
+        raise ValueError(f"Unknown allocation {allocation!r}: use one of {ALLOCATIONS}")
+    if len(sizes) == 0:
+        return sizes
+    if allocation == "equal":
+        return np.full(len(sizes), int(total / len(sizes)), dtype=np.int64)
+    exact = total * sizes / max(sizes.sum(), 1)
+    quota = np.floor(exact).astype(np.int64)
+    remainder = int(total - quota.sum()) if sizes.sum() else 0
+    quota[np.argsort(-(exact - quota), kind="stable")[:remainder]] += 1
+    return quota
+
+
+def stratified_sample(df, strata='company_name', fraction=0.20, total=None, allocation="equal",
+                      include=None, random_state=42, return_plan=False):
+    """
+    Sample rows of `df` without replacement, stratified by the `strata` column.
+
+    Parameters:
+        fraction (float): Sample size as a share of len(df) (ignored if `total` is given).
+        total (int): Sample size in rows.
+        allocation (str): "equal" rows per stratum or "proportional" to stratum size.
+        include (list): Strata to sample from, in this order (repeats are ignored);
+                        default: every stratum in order of appearance.
+        return_plan (bool): Also return the plan, one row per stratum with the rows
+                            available, the quota asked for and the rows sampled.
+    Returns:
+        pd.DataFrame (and the plan): sampled rows grouped by stratum, with a fresh index.
+    """
+    if total is None:
+        total = int(len(df) * fraction)
+    if include is None:
+        codes, labels = pd.factorize(df[strata])
+    else:
+        # A stratum listed twice is sampled once, at its first position
+        labels = pd.Index(pd.unique(np.asarray(include)))
+        codes = labels.get_indexer(df[strata])
+    available = np.bincount(codes[codes >= 0], minlength=len(labels))
+    requested = allocate(available, total, allocation)
+    # Without replacement a stratum cannot give more rows than it has
+    quota = np.minimum(requested, available)
+
+    # Random key per row; sorting by (stratum, key) shuffles every stratum in one pass
+    rng = np.random.default_rng(random_state)
+    keys = rng.random(len(df))
+    order = np.lexsort((keys, codes))
+    order = order[codes[order] >= 0]
+    sorted_codes = codes[order]
+    starts = np.cumsum(available) - available
+    rank = np.arange(len(order)) - starts[sorted_codes]
+    sample = df.iloc[order[rank < quota[sorted_codes]]].reset_index(drop=True)
+
+    if not return_plan:
+        return sample
+    plan = pd.DataFrame({
+        strata: labels,
+        "available": available,
+        "requested": requested,
+        "sampled": quota,
+    })
+    plan["shortfall"] = plan["requested"] - plan["sampled"]
+    return sample, plan
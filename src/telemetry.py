@@ -0,0 +1,235 @@
+"""
+
+This module provides request telemetry for annotation runs:
+ Record every API call (latency, time to first byte, token usage, outcome and
+ parse result) to a JSONL trace, show a live progress line with throughput,
+ ETA and latency percentiles, and summarize the run per model at the end.
+
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+TRACE_FIELDS = [
+    "time", "model", "endpoint", "argQ_id", "setting", "run", "attempt", "outcome", "status_code",
+    "queue_wait", "latency", "ttfb", "prompt_tokens", "completion_tokens", "parse_ok", "error",
+]
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if len(values) else float("nan")
+
+
+def format_duration(seconds):
+    if seconds != seconds or seconds == float("inf"):
+        return "--"
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+class ModelStats:
+    """Running totals of one model's calls, with latency and TTFB over the last `window` timed calls."""
+
+    def __init__(self, window):
+        self.requests = 0
+        self.ok = 0
+        self.cached = 0
+        self.errors = 0
+        self.throttled = 0
+        self.parsed = 0
+        self.parse_failures = 0
+        self.latency_sum = 0.0
+        self.latency_count = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.latencies = deque(maxlen=window)
+        self.ttfbs = deque(maxlen=window)
+
+    def add(self, record):
+        self.requests += 1
+        self.ok += record["outcome"] == "ok"
+        self.cached += record["outcome"] == "cached"
+        self.errors += record["outcome"] == "error"
+        self.throttled += record["status_code"] == 429
+        if record["parse_ok"] is not None:
+            self.parsed += 1
+            self.parse_failures += not record["parse_ok"]
+        if record["outcome"] != "cached":
+            if record["latency"] is not None:
+                self.latency_sum += record["latency"]
+                self.latency_count += 1
+                self.latencies.append(record["latency"])
+            if record["ttfb"] is not None:
+                self.ttfbs.append(record["ttfb"])
+        self.prompt_tokens += record["prompt_tokens"] or 0
+        self.completion_tokens += record["completion_tokens"] or 0
+
+
+class Telemetry:
+    """
+    Collector shared by every call of a run; safe to use from worker threads.
+
+    Only running totals and the latencies of the last `window` calls are kept
+    in memory, so percentiles describe recent calls; the trace file holds the
+    full history.
+
+    Parameters:
+        trace_path (str): JSONL file receiving one record per API call (optional).
+        total (int): Rows expected, for the ETA of the progress line.
+        progress (bool): Redraw a one-line progress display on `stream`.
+        interval (float): Minimum seconds between progress redraws.
+        window (int): Recent latencies kept for the percentiles (overall and per model).
+    """
+
+    def __init__(self, trace_path=None, total=None, progress=True, interval=1.0, stream=None, window=10_000):
+        self.trace_path = trace_path
+        self.trace = open(trace_path, "a", encoding="utf-8") if trace_path else None
+        self.total = total
+        self.progress = progress
+        self.interval = interval
+        self.stream = stream if stream is not None else sys.stderr
+        self.window = window
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.recent_latencies = deque(maxlen=window)
+        self.models = {}
+        self.stages = {}
+        self.rows_done = 0
+        self.started = time.monotonic()
+        self.last_draw = 0.0
+
+    def record(self, **fields):
+        """Count one request record and append it to the trace; missing TRACE_FIELDS are left empty."""
+        record = {name: fields.get(name) for name in TRACE_FIELDS}
+        record["time"] = record["time"] or time.time()
+        with self.lock:
+            self.requests += 1
+            if record["latency"] is not None and record["outcome"] != "cached":
+                self.recent_latencies.append(record["latency"])
+            stats = self.models.get(record["model"])
+            if stats is None:
+                stats = self.models[record["model"]] = ModelStats(self.window)
+            stats.add(record)
+            if self.trace is not None:
+                self.trace.write(json.dumps(record, default=str) + "\n")
+
+    @contextmanager
+    def stage(self, name):
+        """Accumulate the wall time spent in a named step (e.g. aggregation)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                calls, total = self.stages.get(name, (0, 0.0))
+                self.stages[name] = (calls + 1, total + elapsed)
+
+    def row_done(self, rows=1):
+        with self.lock:
+            self.rows_done += rows
+        self.draw()
+
+    def latencies(self):
+        """Latencies of the last `window` calls that reached the API."""
+        with self.lock:
+            return list(self.recent_latencies)
+
+    def progress_line(self):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        latencies = self.latencies()
+        rate = self.requests / elapsed
+        row_rate = self.rows_done / elapsed
+        line = f"{self.rows_done}/{self.total}" if self.total else f"{self.rows_done}"
+        line += f" rows | {self.requests} requests | {rate:.1f} req/s"
+        line += f" | p50 {percentile(latencies, 50):.2f}s p95 {percentile(latencies, 95):.2f}s"
+        if self.total:
+            remaining = (self.total - self.rows_done) / row_rate if row_rate else float("inf")
+            line += f" | ETA {format_duration(remaining)}"
+        return line
+
+    def draw(self, force=False):
+        if not self.progress:
+            return
+        now = time.monotonic()
+        if not force and now - self.last_draw < self.interval:
+            return
+        self.last_draw = now
+        self.stream.write("\r" + self.progress_line() + "\033[K")
+        self.stream.flush()
+
+    def to_frame(self):
+        """Every record of the trace file (which may also hold earlier runs appended to it)."""
+        if self.trace_path is None:
+            raise ValueError("only a telemetry with a trace_path keeps the request records")
+        with self.lock:
+            if self.trace is not None:
+                self.trace.flush()
+        return pd.read_json(self.trace_path, lines=True, dtype=False).reindex(columns=TRACE_FIELDS)
+
+    def summary(self):
+        """
+        Per-model request counts, outcomes, latency/TTFB percentiles (over the
+        last `window` calls of the model), tokens and throughput.
+        """
+        elapsed = time.monotonic() - self.started
+        with self.lock:
+            models = sorted(self.models.items(), key=lambda item: str(item[0]))
+            rows = []
+            for model, stats in models:
+                latency = np.fromiter(stats.latencies, dtype=float)
+                ttfb = np.fromiter(stats.ttfbs, dtype=float)
+                rows.append({
+                    "model": model,
+                    "requests": stats.requests,
+                    "ok": stats.ok,
+                    "cached": stats.cached,
+                    "errors": stats.errors,
+                    "throttled": stats.throttled,
+                    "parse_failure_rate": stats.parse_failures / stats.parsed if stats.parsed else float("nan"),
+                    "requests_per_s": stats.requests / elapsed if elapsed else float("nan"),
+                    "latency_mean": stats.latency_sum / stats.latency_count if stats.latency_count else float("nan"),
+                    "latency_p50": percentile(latency, 50),
+                    "latency_p95": percentile(latency, 95),
+                    "latency_p99": percentile(latency, 99),
+                    "ttfb_p50": percentile(ttfb, 50),
+                    "ttfb_p95": percentile(ttfb, 95),
+                    "prompt_tokens": stats.prompt_tokens,
+                    "completion_tokens": stats.completion_tokens,
+                })
+        return pd.DataFrame(rows)
+
+    def report(self):
+        """Print the summary (and the time spent per stage) after the run."""
+        if self.progress:
+            self.draw(force=True)
+            self.stream.write("\n")
+        summary = self.summary()
+        elapsed = time.monotonic() - self.started
+        print(f"Telemetry: {self.requests} requests for {self.rows_done} rows in {format_duration(elapsed)}")
+        if len(summary):
+            print(summary.round(3).to_string(index=False))
+        for name, (calls, total) in sorted(self.stages.items()):
+            print(f"  {name}: {total:.3f}s over {calls} calls")
+        if self.trace_path:
+            print(f"Request trace saved to {self.trace_path}")
+        return summary
+
+    def close(self):
+        if self.trace is not None:
+            self.trace.close()
+            self.trace = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()